@@ -1,10 +1,13 @@
+import gzip
 import json
 import logging
 import os
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Optional
 from itertools import groupby
+from urllib.parse import urlsplit
 
 import boto3
 import tantivy
@@ -16,20 +19,55 @@ try:
 except ImportError:
     PSUTIL_AVAILABLE = False
 
-from models import JSONData, AppItem, AppDayData, SourceInfo, SourceDetails
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+from models import JSONData, JSONItem, JSONList, AppItem, AppDayData, SourceInfo, SourceDetails
 
 logger = logging.getLogger(__name__)
 
 
+def canonical_url(url: str) -> Optional[str]:
+    """A list's repository URL as the crawler canonicalizes it, None if not http(s)
+
+    Mirrors awesome_crawler.urls.canonical_url: https, lowercase host without
+    www., no query, fragment, trailing slash or .git, and GitHub paths
+    lowercased and cut to owner/repo.
+    """
+    parts = urlsplit(url.strip())
+    if parts.scheme.lower() not in ("http", "https") or not parts.netloc:
+        return None
+    host = parts.netloc.lower().removeprefix("www.")
+    path = parts.path.rstrip("/").removesuffix(".git").rstrip("/")
+    if host == "github.com":
+        path = "/".join(path.lower().split("/")[:3])
+    return f"https://{host}{path}"
+
+
 class DataService:
     def __init__(self, 
                  data_source: str = "s3",
                  bucket_name: str = "awesome-crawler.allocsoc.net", 
                  s3_key: str = "data.json",
-                 local_file_path: str = "data/data.json"):
+                 local_file_path: str = "data/data.json",
+                 journal_key: str = "journal.json",
+                 manifest_key: str = "manifest.json",
+                 aliases_key: str = "aliases.json"):
         self.data_source = data_source.lower()
         self.bucket_name = bucket_name
         self.s3_key = s3_key
+        self.journal_key = journal_key
+        self.manifest_key = manifest_key
+        self.aliases_key = aliases_key
         self.local_file_path = local_file_path
         
         # Only initialize S3 client if using S3
@@ -44,6 +82,13 @@ class DataService:
         self.sources: List[SourceInfo] = []  # Pre-computed sources ordered by date
         self.sources_by_name: dict[str, tuple[SourceDetails, List[AppItem]]] = {}  # Fast source lookup
         self.last_updated: Optional[datetime] = None
+        # Crawler journal: the snapshot run loaded and the entries applied on top
+        self.snapshot_run: Optional[str] = None
+        self.applied_entries: List[str] = []
+        # Parsed shards of a sharded snapshot by content hash, kept across reloads
+        self.shards_by_hash: dict[str, dict] = {}
+        # Canonical URLs of renamed repositories to the URL they moved to
+        self.aliases: dict[str, str] = {}
         # Tantivy search index for items
         self.search_index: Optional[tantivy.Index] = None
         self.searcher: Optional[tantivy.Searcher] = None
@@ -70,12 +115,23 @@ class DataService:
                 logger.error("S3 client not initialized")
                 return False
             
-            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.s3_key)
-            content = response['Body'].read().decode('utf-8')
-            
-            data_dict = json.loads(content)
+            self.aliases = self._read_aliases()
+            journal = self._read_journal()
+            if journal.get("layout") == "sharded":
+                data_dict = self._read_shards()
+            else:
+                response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.s3_key)
+                data_dict = self._decode(response)
+
             self.raw_data = JSONData(**data_dict)
             logger.info(f"Data from S3 successfully loaded into memory - {len(data_dict.get('lists', []))} lists parsed")
+
+            self.snapshot_run = journal["snapshot"]
+            self.applied_entries = []
+            for key in journal["entries"]:
+                self._apply_entry(self._read_entry(key))
+                self.applied_entries.append(key)
+            logger.info(f"Applied {len(self.applied_entries)} journal entries on top of the snapshot")
             
             # Convert to internal format
             self._process_data()
@@ -118,6 +174,172 @@ class DataService:
             logger.error(f"Unexpected error loading local data: {e}")
             return False
 
+    def reload_data(self) -> bool:
+        """Apply the journal entries written since the last load
+
+        The whole data is only loaded again when the crawler compacted the
+        journal into a new snapshot, or when reading from a local file.
+        """
+        if self.data_source != "s3" or not self.raw_data:
+            return self.load_data()
+
+        try:
+            journal = self._read_journal()
+            if journal["snapshot"] != self.snapshot_run:
+                logger.info(f"New snapshot {journal['snapshot']}, loading all data")
+                return self._load_data_from_s3()
+
+            new_entries = [key for key in journal["entries"] if key not in self.applied_entries]
+            start = len(self.items)
+            for key in new_entries:
+                self.items.extend(self._apply_entry(self._read_entry(key)))
+                self.applied_entries.append(key)
+
+            if new_entries:
+                self._build_timeline()
+                self._build_sources()
+                self._add_to_search_index(start)
+                self._build_sources_search_index()
+                self.last_updated = datetime.now()
+
+            logger.info(f"Applied {len(new_entries)} journal entries with {len(self.items) - start} new items")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error applying journal entries: {e}")
+            return False
+
+    def _read_journal(self) -> dict:
+        """The crawler journal, empty when there is none yet"""
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.journal_key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "NoSuchKey":
+                raise
+            return {"snapshot": "", "entries": []}
+        return json.loads(response['Body'].read())
+
+    def _read_aliases(self) -> dict[str, str]:
+        """The crawler's alias index of renamed repositories, empty when there is none"""
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.aliases_key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "NoSuchKey":
+                raise
+            return {}
+        return json.loads(response['Body'].read())["aliases"]
+
+    def _repository(self, url: str) -> Optional[str]:
+        """The canonical URL of the repository at url, following renames"""
+        current = canonical_url(url)
+        seen = set()
+        while current in self.aliases and current not in seen:
+            seen.add(current)
+            current = self.aliases[current]
+        return current
+
+    def _collapse_lists(self):
+        """Keep one list per repository, the first, with the items of the others
+
+        Lists without a canonical URL are kept as they are.
+        """
+        lists = []
+        lists_by_repository = {}
+        for list_data in self.raw_data.lists:
+            repository = self._repository(list_data.source)
+            kept = lists_by_repository.get(repository) if repository else None
+            if kept is None:
+                lists.append(list_data)
+                if repository:
+                    lists_by_repository[repository] = list_data
+            else:
+                names = {item.name for item in kept.items}
+                kept.items.extend(item for item in list_data.items if item.name not in names)
+        self.raw_data.lists = lists
+
+    def _read_shards(self) -> dict:
+        """The sharded snapshot, downloading only the shards not seen before
+
+        Shards are fetched in parallel and looked up by the hash the manifest
+        lists, so a reload after compaction only fetches the lists that changed.
+        """
+        response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.manifest_key)
+        shards = json.loads(response['Body'].read())["shards"]
+
+        def fetch(shard: dict) -> tuple[str, dict]:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=shard["key"])
+            return shard["hash"], json.loads(gzip.decompress(response['Body'].read()))
+
+        missing = {shard["hash"]: shard for shard in shards if shard["hash"] not in self.shards_by_hash}
+        logger.info(f"Downloading {len(missing)} of {len(shards)} shards")
+        with ThreadPoolExecutor(16) as executor:
+            fetched = dict(executor.map(fetch, missing.values()))
+
+        wanted = {shard["hash"] for shard in shards}
+        self.shards_by_hash = {
+            digest: data for digest, data in {**self.shards_by_hash, **fetched}.items() if digest in wanted
+        }
+        return {"lists": [self.shards_by_hash[shard["hash"]] for shard in shards]}
+
+    def _read_entry(self, key: str) -> JSONData:
+        response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+        return JSONData(**self._decode(response))
+
+    def _decode(self, response: dict) -> dict:
+        """The body of an S3 object written by the crawler, decoded by its metadata
+
+        The Content-Encoding says how it is compressed (gzip, zstd or not at
+        all) and the Content-Type whether it is JSON or msgpack.
+        """
+        body = response['Body'].read()
+        encoding = response.get('ContentEncoding')
+        if encoding == "gzip":
+            body = gzip.decompress(body)
+        elif encoding == "zstd":
+            if not ZSTD_AVAILABLE:
+                raise RuntimeError("zstandard is needed to read zstd compressed data")
+            body = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+
+        if response.get('ContentType') == "application/msgpack":
+            if not MSGPACK_AVAILABLE:
+                raise RuntimeError("msgpack is needed to read msgpack data")
+            return msgpack.unpackb(body)
+        return json.loads(body)
+
+    def _apply_entry(self, entry: JSONData) -> List[AppItem]:
+        """Merge a journal entry into the raw data as the crawler does
+
+        Items are added to their list unless it has one with the same name,
+        lists are added unless one has the same name or repository. Returns
+        the new items.
+        """
+        lists_by_name = {}
+        lists_by_repository = {}
+        for list_data in self.raw_data.lists:
+            lists_by_name.setdefault(list_data.name, list_data)
+            repository = self._repository(list_data.source)
+            if repository:
+                lists_by_repository.setdefault(repository, list_data)
+
+        new_items = []
+        for entry_list in entry.lists:
+            list_data = lists_by_name.get(entry_list.name)
+            repository = self._repository(entry_list.source)
+            if list_data is None and repository:
+                list_data = lists_by_repository.get(repository)
+            if list_data is None:
+                self.raw_data.lists.append(entry_list)
+                lists_by_name[entry_list.name] = entry_list
+                if repository:
+                    lists_by_repository[repository] = entry_list
+                list_data, added = entry_list, entry_list.items
+            else:
+                names = {item.name for item in list_data.items}
+                added = [item for item in entry_list.items if item.name not in names]
+                list_data.items.extend(added)
+            new_items.extend(self._to_app_items(list_data, added))
+        return new_items
+
     # Keep backward compatibility
     def load_data_from_s3(self) -> bool:
         """Backward compatibility method - use load_data() instead"""
@@ -127,33 +349,40 @@ class DataService:
         """Convert raw JSON data to internal AppItem format"""
         if not self.raw_data:
             return
-            
+
+        self._collapse_lists()
         items = []
         for list_data in self.raw_data.lists:
-            for item in list_data.items:
-                try:
-                    # Parse the time string - handle different formats
-                    time_str = item.time.split("T")[0]  # Get date part only
-                    time_obj = datetime.fromisoformat(time_str)
-                    
-                    app_item = AppItem(
-                        name=item.name,
-                        description=item.description,
-                        source=item.source,
-                        list_name=list_data.name,
-                        list_source=list_data.source,
-                        time=time_obj
-                    )
-                    items.append(app_item)
-                except Exception as e:
-                    logger.warning(f"Error processing item {item.name}: {e}")
-                    continue
+            items.extend(self._to_app_items(list_data, list_data.items))
         
         self.items = items
         self._build_timeline()
         self._build_sources()
         self._build_search_index()
         self._build_sources_search_index()
+
+    def _to_app_items(self, list_data: JSONList, list_items: List[JSONItem]) -> List[AppItem]:
+        """Convert items of a raw JSON list to the internal AppItem format"""
+        items = []
+        for item in list_items:
+            try:
+                # Parse the time string - handle different formats
+                time_str = item.time.split("T")[0]  # Get date part only
+                time_obj = datetime.fromisoformat(time_str)
+                
+                app_item = AppItem(
+                    name=item.name,
+                    description=item.description,
+                    source=item.source,
+                    list_name=list_data.name,
+                    list_source=list_data.source,
+                    time=time_obj
+                )
+                items.append(app_item)
+            except Exception as e:
+                logger.warning(f"Error processing item {item.name}: {e}")
+                continue
+        return items
     
     def _build_timeline(self):
         """Group items by date and build timeline"""
@@ -279,6 +508,32 @@ class DataService:
             self.search_index = None
             self.searcher = None
     
+    def _add_to_search_index(self, start: int):
+        """Index the items from `start` on, which were added since the last build"""
+        if not self.search_index:
+            self._build_search_index()
+            return
+
+        try:
+            writer = self.search_index.writer()
+            for i, item in enumerate(self.items[start:], start):
+                writer.add_document(tantivy.Document(
+                    name=item.name or "",
+                    description=item.description or "",
+                    list_name=item.list_name or "",
+                    source=item.source or "",
+                    item_id=i
+                ))
+            writer.commit()
+
+            self.search_index.reload()
+            self.searcher = self.search_index.searcher()
+            logger.info(f"Search index updated with {len(self.items) - start} new items")
+
+        except Exception as e:
+            logger.error(f"Error updating search index: {e}")
+            self._build_search_index()
+
     def _build_sources_search_index(self):
         """Build Tantivy search index for sources"""
         if not self.sources:
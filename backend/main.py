@@ -311,7 +311,7 @@ async def reload_data():
     source_name = DATA_SOURCE.upper()
     logger.info(f"Reloading data from {source_name}...")
 
-    success = data_service.load_data()
+    success = data_service.reload_data()
     if not success:
         raise HTTPException(status_code=500, detail=f"Failed to reload data from {source_name}")
 
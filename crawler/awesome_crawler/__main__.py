@@ -1,27 +1,48 @@
 import logging
+from collections import Counter
+from functools import cache
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
 import click
 
-from awesome_crawler.find_awesome_repos import find_repos
-from awesome_crawler.output import generate_json
-from awesome_crawler.process import crawl_awesome, AwesomeList
-from awesome_crawler.delta import get_last
-from awesome_crawler.serialize import deserialize
-from awesome_crawler.sampling import filter_repositories_by_activity, log_sampling_statistics
+from awesome_crawler.awesome_repo import CLONE_FULL, CLONE_MODES
+from awesome_crawler.checkpoint import CHECKPOINT_CACHE, Checkpoint, default_run_id, latest_run, resume_crawl
+from awesome_crawler.find_awesome_repos import find_repos, stored_names, unique_repositories
+from awesome_crawler.output import PART_SIZE, UPLOAD_WORKERS, UploadConfig, generate_json
+from awesome_crawler.process import FETCH_WORKERS, LIST_TIMEOUT, collect_stats, crawl_awesome, AwesomeList
+from awesome_crawler.delta import load_current
+from awesome_crawler.serialize import CODEC_JSON, CODECS, LAYOUT_MONOLITHIC, LAYOUTS, Output
+from awesome_crawler.extractor import ENGINE_AST, ENGINES
+from awesome_crawler.stats import ListStats, merge_stats, read_aliases, read_stats, write_aliases, write_stats
+from awesome_crawler.urls import AliasIndex
+from awesome_crawler.sampling import MAX_STALENESS_DAYS, last_update_index, log_sampling_statistics, schedule_repositories
 
 
-def get_repos_from_s3():
+@cache
+def current_data(cache_dir: Optional[Path] = None) -> Output:
+    """The S3 data, downloaded and decoded once per run
+
+    Sampling, the repository list and the delta all read it; a failed load
+    is not cached and is tried again by the next caller. With `cache_dir`
+    it is only downloaded when it changed since the previous run.
+    """
+    return load_current(cache_dir)
+
+
+def get_repos_from_s3(cache_dir: Optional[Path] = None, aliases: Optional[AliasIndex] = None):
     """Get repository list from S3 data instead of running discovery"""
+    aliases = aliases if aliases is not None else AliasIndex()
     try:
-        s3_data = get_last()
+        output = current_data(cache_dir)
         print("🔄 Extracting repository list from S3 data...")
-        output = deserialize(s3_data)
         repos = []
         for list_data in output.lists:
             repo = AwesomeList(list_data.name, list_data.source, list_data.description)
             repos.append(repo)
+        # a repository stored under two names is crawled once, as the first
+        repos = unique_repositories(repos, aliases)
         print(f"✅ Extracted {len(repos)} repositories from S3 data")
         return repos
     except Exception as e:
@@ -29,7 +50,7 @@ def get_repos_from_s3():
         print("🔄 Falling back to discovery...")
         logging.error(f"Failed to get repos from S3: {e}")
         logging.info("Falling back to discovery")
-        return find_repos()
+        return find_repos(cache_dir, aliases)
 
 
 def should_run_discovery():
@@ -42,58 +63,235 @@ def should_run_discovery():
 @click.option("--logs/--no-logs", default=False)
 @click.option("--write-s3/--no-write-s3", default=True)
 @click.option("--force-discovery/--no-force-discovery", default=False)
-@click.option("--probabilistic-sampling/--no-probabilistic-sampling", default=True)
-def main(all: bool, logs: bool, write_s3: bool, force_discovery: bool, probabilistic_sampling: bool):
+@click.option(
+    "--schedule/--no-schedule",
+    "--probabilistic-sampling/--no-probabilistic-sampling",
+    "schedule",
+    default=True,
+    help="Only crawl the lists that are due, see --budget-lists and --budget-seconds",
+)
+@click.option(
+    "--budget-lists",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Scheduled lists per run; without a budget, lists expected to have new items",
+)
+@click.option(
+    "--budget-seconds",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="Estimated crawl seconds of the scheduled lists, from the previous stats",
+)
+@click.option(
+    "--max-staleness",
+    type=click.FloatRange(min=0),
+    default=MAX_STALENESS_DAYS,
+    help="Days after which a list is crawled before any other, budget permitting",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    envvar="AWESOME_CACHE_DIR",
+    default=None,
+    help="Keep bare mirrors of the crawled lists, the S3 data and discovery results here, and only fetch what changed",
+)
+@click.option(
+    "--clone-mode",
+    type=click.Choice(CLONE_MODES),
+    default=CLONE_FULL,
+    help="shallow: only fetch the commits that are processed, partial: fetch blobs lazily",
+)
+@click.option(
+    "--incremental/--no-incremental",
+    default=False,
+    help="Only extract the list items that changed between README versions",
+)
+@click.option(
+    "--extractor",
+    type=click.Choice(ENGINES),
+    default=ENGINE_AST,
+    help="fast: match conventional list items with regexes, parsing the rest",
+)
+@click.option(
+    "--fetch-workers",
+    type=click.IntRange(min=1),
+    default=FETCH_WORKERS,
+    help="Repositories cloned or fetched at the same time",
+)
+@click.option(
+    "--parse-workers",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Processes extracting the fetched repositories, one per CPU (at most 8) by default",
+)
+@click.option(
+    "--list-timeout",
+    type=click.FloatRange(min=0),
+    default=LIST_TIMEOUT,
+    help="Seconds before giving up on a list, recorded in the stats; 0 waits forever",
+)
+@click.option(
+    "--probe/--no-probe",
+    default=True,
+    help="Skip the lists whose remote HEAD hasn't moved since the last run",
+)
+@click.option(
+    "--layout",
+    type=click.Choice(LAYOUTS),
+    default=LAYOUT_MONOLITHIC,
+    help="sharded: compact the journal into one object per list plus a manifest",
+)
+@click.option(
+    "--codec",
+    type=click.Choice(CODECS),
+    default=CODEC_JSON,
+    help="How journal entries and the snapshot are encoded on S3, readers accept any",
+)
+@click.option(
+    "--upload-part-size",
+    type=click.IntRange(min=5),
+    default=PART_SIZE // 2**20,
+    help="MB per part of the multipart snapshot upload",
+)
+@click.option(
+    "--upload-workers",
+    type=click.IntRange(min=1),
+    default=UPLOAD_WORKERS,
+    help="Parts of the snapshot uploaded at the same time",
+)
+@click.option(
+    "--checkpoint-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    envvar="AWESOME_CHECKPOINT_DIR",
+    default=None,
+    help="Save each crawled list here as it completes, the checkpoints directory of --cache-dir by default",
+)
+@click.option(
+    "--run-id",
+    default=None,
+    help="Runs with the same id share their checkpoints; by default a new run gets its start time and --resume the last unfinished run",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=False,
+    help="Only crawl the lists not checkpointed by the run, then write the output",
+)
+def main(all: bool, logs: bool, write_s3: bool, force_discovery: bool, schedule: bool, budget_lists: Optional[int], budget_seconds: Optional[float], max_staleness: float, cache_dir: Optional[Path], clone_mode: str, incremental: bool, extractor: str, fetch_workers: int, parse_workers: Optional[int], list_timeout: float, probe: bool, layout: str, codec: str, upload_part_size: int, upload_workers: int, checkpoint_dir: Optional[Path], run_id: Optional[str], resume: bool):
     print(f"🚀 Starting awesome crawler...")
-    print(f"📋 Configuration: logs={logs}, all={all}, write_s3={write_s3}, force_discovery={force_discovery}, probabilistic_sampling={probabilistic_sampling}")
+    print(f"📋 Configuration: logs={logs}, all={all}, write_s3={write_s3}, force_discovery={force_discovery}, schedule={schedule}, budget_lists={budget_lists}, budget_seconds={budget_seconds}, max_staleness={max_staleness}, cache_dir={cache_dir}, clone_mode={clone_mode}, incremental={incremental}, extractor={extractor}, fetch_workers={fetch_workers}, parse_workers={parse_workers}, list_timeout={list_timeout}, probe={probe}, layout={layout}, codec={codec}, upload_part_size={upload_part_size}, upload_workers={upload_workers}, checkpoint_dir={checkpoint_dir}, run_id={run_id}, resume={resume}")
     
     if logs:
         logging.basicConfig(filename="crawler.log", level=logging.INFO)
     else:
         logging.basicConfig(level=logging.ERROR)
 
-    # Get S3 data for probabilistic sampling (even on discovery days)
+    checkpoint_dir = checkpoint_dir or (cache_dir and cache_dir / CHECKPOINT_CACHE)
+    if resume and not checkpoint_dir:
+        raise click.UsageError("--resume needs --checkpoint-dir or --cache-dir")
+    checkpoint = None
+    if checkpoint_dir:
+        run_id = run_id or (resume and latest_run(checkpoint_dir)) or default_run_id()
+        checkpoint = Checkpoint(checkpoint_dir, run_id)
+        checkpoint.start(resume)
+        print(f"📌 Checkpointing crawled lists in {checkpoint.path}")
+
+    # Get S3 data for scheduling (even on discovery days)
     s3_data = None
-    if probabilistic_sampling:
+    if schedule:
         try:
-            print("🔍 Loading S3 data for probabilistic sampling...")
-            s3_data_str = get_last()
-            print("🔄 Parsing S3 data...")
-            s3_data = deserialize(s3_data_str)
-            print("✅ S3 data loaded successfully for probabilistic sampling")
-            logging.info("S3 data loaded for probabilistic sampling")
+            print("🔍 Loading S3 data for scheduling...")
+            s3_data = current_data(cache_dir)
+            print("✅ S3 data loaded successfully for scheduling")
+            logging.info("S3 data loaded for scheduling")
         except Exception as e:
-            print(f"⚠️  Could not load S3 data for sampling: {e}")
-            logging.warning(f"Could not load S3 data for sampling: {e}")
+            print(f"⚠️  Could not load S3 data for scheduling: {e}")
+            logging.warning(f"Could not load S3 data for scheduling: {e}")
+
+    dest = None if write_s3 else Path("./output.json")
+    aliases = read_aliases(dest)
 
     # Determine whether to run discovery or use S3 data
     if force_discovery or should_run_discovery():
         print("🔍 Running repository discovery (Monday or forced)...")
         logging.info("Running repository discovery (Monday or forced)")
-        list_of_awesome_projects = find_repos()
+        list_of_awesome_projects = find_repos(cache_dir, aliases)
+        try:
+            list_of_awesome_projects = stored_names(list_of_awesome_projects, current_data(cache_dir), aliases)
+        except Exception as e:
+            print(f"⚠️  Could not match renamed repositories to the S3 data: {e}")
+            logging.warning(f"Could not match renamed repositories to the S3 data: {e}")
+        write_aliases(aliases, dest)
     else:
         print("📂 Using repository list from S3 data (non-Monday)...")
         logging.info("Using repository list from S3 data (non-Monday)")
-        list_of_awesome_projects = get_repos_from_s3()
+        list_of_awesome_projects = get_repos_from_s3(cache_dir, aliases)
     
     print(f"📊 Found {len(list_of_awesome_projects)} repositories")
     
-    # Apply probabilistic sampling based on repository activity
-    if probabilistic_sampling and s3_data:
-        print("🎲 Applying probabilistic sampling based on repository activity...")
-        logging.info("Applying probabilistic sampling based on repository activity")
-        log_sampling_statistics(list_of_awesome_projects, s3_data)
-        list_of_awesome_projects = filter_repositories_by_activity(list_of_awesome_projects, s3_data)
-    
+    print("⏱️  Loading the stats of the previous run...")
+    previous_stats = read_stats(dest)
+
+    # Only crawl the lists that are due, by staleness and expected changes
+    if schedule and s3_data:
+        print("🗓️  Scheduling repositories by staleness and expected changes...")
+        logging.info("Scheduling repositories by staleness and expected changes")
+        log_sampling_statistics(list_of_awesome_projects, last_update_index(s3_data))
+        list_of_awesome_projects = schedule_repositories(
+            list_of_awesome_projects,
+            s3_data,
+            previous_stats,
+            budget_lists,
+            budget_seconds,
+            max_staleness,
+        )
+
     print(f"⚡ Processing {len(list_of_awesome_projects)} repositories...")
     logging.info(f"Processing {len(list_of_awesome_projects)} repositories")
     limit_commits = None if all else 10
-    items = crawl_awesome(list_of_awesome_projects, limit_commits)
-    items_flatten = [x for i in items for x in i]
 
-    dest = None if write_s3 else Path("./output.json")
-    print("💾 Generating and saving output...")
-    generate_json(items_flatten, dest)
+    def crawl(repos: list[AwesomeList]):
+        return crawl_awesome(
+            repos,
+            limit_commits,
+            cache_dir,
+            clone_mode,
+            incremental,
+            extractor,
+            fetch_workers,
+            parse_workers,
+            previous_stats,
+            list_timeout or None,
+            probe,
+        )
+
+    if checkpoint:
+        results = resume_crawl(checkpoint, list_of_awesome_projects, crawl)
+    else:
+        results = crawl(list_of_awesome_projects)
+    names = Counter(repo.name for repo in list_of_awesome_projects)
+    held_back = {name for name, count in names.items() if count > 1}
+    stats: list[ListStats] = []
+
+    print("💾 Generating and saving output as repositories complete...")
+    generate_json(
+        collect_stats(results, stats),
+        dest,
+        held_back,
+        layout,
+        codec,
+        current_data(cache_dir),
+        UploadConfig(upload_part_size * 2**20, upload_workers),
+        aliases,
+    )
+    write_stats(merge_stats(previous_stats, stats), dest)
+    if checkpoint:
+        checkpoint.clear()
+
+    timed_out = [s.name for s in stats if s.timed_out]
+    if timed_out:
+        print(f"⚠️  {len(timed_out)} repositories timed out: {', '.join(timed_out)}")
+        logging.warning(f"Repositories timed out: {timed_out}")
+
     print("🎉 Crawler execution completed!")
 
 
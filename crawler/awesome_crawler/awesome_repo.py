@@ -1,19 +1,46 @@
+import difflib
+import hashlib
 import io
 import logging
 import shutil
+import time
 from dataclasses import dataclass
 from datetime import datetime
 from itertools import groupby
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Iterable
+from typing import Iterable, Optional
 
 import git
 
-from awesome_crawler.extractor import ExtractInfo, extract
+from awesome_crawler.extractor import ENGINE_AST, LIST_ITEM_LINE, ExtractInfo, extract
 
 logger = logging.getLogger(__name__)
 
+GIT_ENV = {"GIT_TERMINAL_PROMPT": "0"}
+# only branches are mirrored, not the pull request refs GitHub also serves
+BRANCHES = "+refs/heads/*:refs/heads/*"
+
+CLONE_FULL = "full"
+CLONE_SHALLOW = "shallow"
+CLONE_PARTIAL = "partial"
+CLONE_MODES = (CLONE_FULL, CLONE_SHALLOW, CLONE_PARTIAL)
+
+README_NAMES = (
+    "README.md",
+    "readme.md",
+    "Readme.md",
+    "README.markdown",
+    "README",
+    "README.rst",
+    "README.txt",
+)
+README_SEARCH_DEPTH = 3
+README_CACHE_SIZE = 10_000
+
+# resolved README path per tree SHA
+_readme_paths: dict[str, Optional[str]] = {}
+
 
 @dataclass
 class AwesomeItemTime:
@@ -21,42 +48,259 @@ class AwesomeItemTime:
     time: datetime
 
 
-def clone(url: str, dest: Path):
+@dataclass
+class ParsedRepo:
+    items: list[AwesomeItemTime]
+    commits: int
+    # the commit the items were extracted up to
+    head: str
+
+
+def clone_options(mode: str, limit: Optional[int] = None) -> dict:
+    """Extra `git clone` options for a clone mode
+
+    `shallow` only fetches the `limit` newest commits and `partial` skips every
+    blob, letting git lazily fetch the README blobs we actually read. The work
+    tree is never checked out since commits are read straight from the objects.
+    """
+    if mode not in CLONE_MODES:
+        raise ValueError(f"unknown clone mode {mode}")
+
+    options: dict = {"no_checkout": True}
+    if mode == CLONE_SHALLOW and limit:
+        options["depth"] = limit
+    if mode == CLONE_PARTIAL:
+        options["filter"] = "blob:none"
+    return options
+
+
+def clone(
+    url: str,
+    dest: Path,
+    mode: str = CLONE_FULL,
+    limit: Optional[int] = None,
+    timeout: Optional[float] = None,
+):
     if dest.exists():
         shutil.rmtree(dest)
 
-    env = {"GIT_TERMINAL_PROMPT": "0"}
-    return git.Repo.clone_from(url, dest, env=env)
+    options = clone_options(mode, limit)
+    git_clone(url, dest, timeout, **options)
+    return git.Repo(dest)
 
 
-def extract_all_commits(url: str, dest: Path, limit=None):
-    repo = clone(url, dest)
-    commits = list(repo.iter_commits(max_count=limit))
+def git_clone(url: str, dest: Path, timeout: Optional[float] = None, **options):
+    """`git clone`, killed after `timeout` seconds unlike `Repo.clone_from`"""
+    git.Git().clone(url, str(dest), env=GIT_ENV, kill_after_timeout=timeout, **options)
+
+
+def remote_head(url: str, timeout: Optional[float] = None) -> str:
+    """The SHA the remote HEAD points to, without fetching anything"""
+    output = git.Git().ls_remote(
+        url, "HEAD", env=GIT_ENV, kill_after_timeout=timeout
+    )
+    return str(output).split()[0]
 
-    for commit in commits:
-        readme_filename = find_readme_file(commit)
 
-        if readme_filename:
-            targetfile = commit.tree / readme_filename
-            with io.BytesIO(targetfile.data_stream.read()) as f:
-                markdown = f.read().decode("utf-8")
-                items = extract(markdown)
+def mirror_path(url: str, cache_dir: Path) -> Path:
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return cache_dir / f"{key}.git"
 
-                for item in items:
-                    yield AwesomeItemTime(
-                        item, datetime.fromtimestamp(commit.committed_date)
-                    )
 
+def update_mirror(
+    url: str,
+    cache_dir: Path,
+    mode: str = CLONE_FULL,
+    timeout: Optional[float] = None,
+) -> git.Repo:
+    """Fetch into the cached bare clone of `url`, cloning it on first use
+
+    Only the branches are fetched, not every ref as `--mirror` would. The
+    clone needs its whole history to find the previously processed commit,
+    so a `shallow` mode is cloned in full; `partial` clones skip the blobs.
+    A fetch killed after `timeout` seconds keeps the clone for the next run.
+    """
+    dest = mirror_path(url, cache_dir)
+
+    if dest.exists():
+        start = time.monotonic()
+        try:
+            repo = git.Repo(dest)
+            repo.git.fetch(
+                "--prune", "origin", BRANCHES, env=GIT_ENV, kill_after_timeout=timeout
+            )
+            logger.info(f"fetched mirror {dest} for {url}")
+            return repo
+        except git.GitError:
+            if timeout and time.monotonic() - start >= timeout:
+                raise
+            logger.warning(f"broken mirror {dest} for {url}, cloning again")
+            shutil.rmtree(dest)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    logger.info(f"cloning mirror {dest} for {url}")
+    options = {"filter": "blob:none"} if mode == CLONE_PARTIAL else {}
+    try:
+        git_clone(url, dest, timeout, bare=True, **options)
+    except git.GitError:
+        shutil.rmtree(dest, ignore_errors=True)
+        raise
+    return git.Repo(dest)
 
-def find_readme_file(commit):
-    filenames = [p.path for p in commit.tree.traverse()]
 
-    readmes = [f for f in filenames if "readme" in f.lower()]
-    if readmes:
-        return readmes[0]
-    else:
+def known_commit(repo: git.Repo, sha: Optional[str]) -> Optional[str]:
+    """`sha` if the repository has it, None to walk all history"""
+    if not sha:
         return None
 
+    try:
+        repo.commit(sha)
+    except (ValueError, git.BadName):
+        logger.warning(f"last processed commit {sha} is gone, walking all history")
+        return None
+
+    return sha
+
+
+def extract_all_commits(
+    repo: git.Repo, limit=None, since: Optional[str] = None, engine: str = ENGINE_AST
+):
+    commits = list(repo.iter_commits(commit_range(since), max_count=limit))
+
+    # most commits don't touch the README, parse each distinct blob only once
+    parsed: dict[str, list[ExtractInfo]] = {}
+
+    for commit in commits:
+        targetfile = find_readme_blob(commit)
+
+        if targetfile:
+            items = parsed.get(targetfile.hexsha)
+            if items is None:
+                items = extract(read_markdown(targetfile), engine)
+                parsed[targetfile.hexsha] = items
+
+            for item in items:
+                yield AwesomeItemTime(
+                    item, datetime.fromtimestamp(commit.committed_date)
+                )
+
+
+def extract_incremental(
+    repo: git.Repo, limit=None, since: Optional[str] = None, engine: str = ENGINE_AST
+) -> Iterable[AwesomeItemTime]:
+    """Extract items with their first seen date from the README diffs
+
+    Commits are walked oldest to newest and only the list item lines that
+    changed between consecutive README blobs are extracted, so the cost grows
+    with the size of the diffs instead of commits times README size. The
+    oldest README (or the one at `since`) is the base everything is diffed
+    against; when it comes from `since` its items are not reported again.
+    """
+    commits = list(repo.iter_commits(commit_range(since), max_count=limit))
+    commits.reverse()
+
+    seen: dict[str, AwesomeItemTime] = {}
+    previous = find_readme_blob(repo.commit(since)) if since else None
+    previous_lines = read_markdown(previous).splitlines() if previous else []
+
+    for commit in commits:
+        targetfile = find_readme_blob(commit)
+        if targetfile is None or (previous and targetfile.hexsha == previous.hexsha):
+            continue
+
+        lines = read_markdown(targetfile).splitlines()
+        if previous is None:
+            items = extract("\n".join(lines), engine)
+        else:
+            changed = changed_list_items(previous_lines, lines)
+            items = extract("\n".join(changed), engine)
+
+        time = datetime.fromtimestamp(commit.committed_date)
+        for item in items:
+            if item.name in seen:
+                seen[item.name].item = item
+            else:
+                seen[item.name] = AwesomeItemTime(item, time)
+
+        previous, previous_lines = targetfile, lines
+
+    return list(seen.values())
+
+
+def changed_list_items(old: list[str], new: list[str]) -> list[str]:
+    """List item lines of `new` that were added or modified since `old`
+
+    The lines are dedented so nested items are extracted on their own.
+    """
+    matcher = difflib.SequenceMatcher(None, old, new)
+    return [
+        line.lstrip()
+        for tag, _, _, j1, j2 in matcher.get_opcodes()
+        if tag in ("replace", "insert")
+        for line in new[j1:j2]
+        if LIST_ITEM_LINE.match(line)
+    ]
+
+
+def commit_range(since: Optional[str]) -> str:
+    return f"{since}..HEAD" if since else "HEAD"
+
+
+def find_readme_blob(commit) -> Optional[git.Blob]:
+    readme_filename = find_readme_file(commit)
+    return commit.tree / readme_filename if readme_filename else None
+
+
+def read_markdown(blob: git.Blob) -> str:
+    with io.BytesIO(blob.data_stream.read()) as f:
+        return f.read().decode("utf-8")
+
+
+def find_readme_file(commit) -> Optional[str]:
+    tree = commit.tree
+    if tree.hexsha in _readme_paths:
+        return _readme_paths[tree.hexsha]
+
+    if len(_readme_paths) >= README_CACHE_SIZE:
+        _readme_paths.clear()
+
+    path = find_readme_in_tree(tree)
+    _readme_paths[tree.hexsha] = path
+    return path
+
+
+def find_readme_in_tree(tree: git.Tree) -> Optional[str]:
+    """Resolve the README of a tree without walking the whole repository
+
+    The root entries are checked against `README_NAMES` first, then any root
+    file named like a readme, and only then the subdirectories up to
+    `README_SEARCH_DEPTH` levels deep.
+    """
+    blobs = {blob.name: str(blob.path) for blob in tree.blobs}
+
+    for name in README_NAMES:
+        if name in blobs:
+            return blobs[name]
+
+    level = [tree]
+    for _ in range(README_SEARCH_DEPTH):
+        readmes = sorted(
+            str(blob.path)
+            for t in level
+            for blob in t.blobs
+            if "readme" in blob.name.lower()
+        )
+        if readmes:
+            return min(readmes, key=readme_rank)
+        level = [subtree for t in level for subtree in t.trees]
+
+    return None
+
+
+def readme_rank(path: str):
+    name = path.rsplit("/", 1)[-1].lower()
+    return (not name.startswith("readme"), not name.endswith(".md"))
+
 
 def get_first_date(items: list[AwesomeItemTime]) -> Iterable[AwesomeItemTime]:
     items.sort(key=lambda i: i.item.name)
@@ -69,8 +313,78 @@ def get_first_date(items: list[AwesomeItemTime]) -> Iterable[AwesomeItemTime]:
         yield AwesomeItemTime(g[-1].item, g[0].time)
 
 
-def process_awesome_repo(url: str, limit: int = None) -> Iterable[AwesomeItemTime]:
+def process_awesome_repo(
+    url: str,
+    limit: int = None,
+    cache_dir: Optional[Path] = None,
+    clone_mode: str = CLONE_FULL,
+    incremental: bool = False,
+    engine: str = ENGINE_AST,
+    since: Optional[str] = None,
+) -> Iterable[AwesomeItemTime]:
+    """Extract the items of an awesome list with the date they were first seen
+
+    Without `cache_dir` the repository is cloned into a temporary directory.
+    With it, a persistent bare mirror is fetched instead. Only the commits
+    newer than `since`, the head a previous run processed, are walked. `incremental` extracts
+    from the README diffs, see `extract_incremental`, and `engine` picks the
+    markdown extractor.
+    """
     with TemporaryDirectory() as temp:
-        dest = Path(temp)
-        x = list(extract_all_commits(url, dest, limit))
-        return get_first_date(x)
+        path = fetch_awesome_repo(url, Path(temp), cache_dir, clone_mode, limit)
+        return parse_awesome_repo(path, limit, since, incremental, engine).items
+
+
+def fetch_awesome_repo(
+    url: str,
+    dest: Path,
+    cache_dir: Optional[Path] = None,
+    clone_mode: str = CLONE_FULL,
+    limit: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Path:
+    """The network half of `process_awesome_repo`, returns the repository path
+
+    The repository is cloned into `dest`, or its mirror in `cache_dir` is
+    fetched when given. git is killed after `timeout` seconds.
+    """
+    if cache_dir is None:
+        clone(url, dest, clone_mode, limit, timeout).close()
+        return dest
+
+    update_mirror(url, cache_dir, clone_mode, timeout).close()
+    return mirror_path(url, cache_dir)
+
+
+def parse_awesome_repo(
+    path: Path,
+    limit: Optional[int] = None,
+    since: Optional[str] = None,
+    incremental: bool = False,
+    engine: str = ENGINE_AST,
+) -> ParsedRepo:
+    """The CPU half of `process_awesome_repo`, on a fetched repository
+
+    Only the commits after `since` are walked, when the repository has it.
+    The head the items were extracted up to is returned rather than stored,
+    the caller records it once the items are written, see `ListStats.head`.
+    """
+    repo = git.Repo(path)
+    try:
+        since = known_commit(repo, since)
+        head = repo.head.commit.hexsha
+        commits = repo.git.rev_list("--count", commit_range(since), max_count=limit)
+        items = extract_first_dates(repo, limit, since, incremental, engine)
+        return ParsedRepo(items, int(commits), head)
+    finally:
+        repo.close()
+
+
+def extract_first_dates(
+    repo: git.Repo, limit, since: Optional[str], incremental: bool, engine: str
+) -> list[AwesomeItemTime]:
+    if incremental:
+        return list(extract_incremental(repo, limit, since, engine))
+
+    x = list(extract_all_commits(repo, limit, since, engine))
+    return list(get_first_date(x))
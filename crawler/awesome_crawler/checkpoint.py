@@ -0,0 +1,145 @@
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+from awesome_crawler.extractor import ExtractInfo
+from awesome_crawler.process import AwesomeItem, AwesomeList, CrawlResult
+from awesome_crawler.stats import ListStats
+
+logger = logging.getLogger(__name__)
+
+# checkpoints are kept in this directory of the cache dir without --checkpoint-dir
+CHECKPOINT_CACHE = "checkpoints"
+RUN_ID_FORMAT = "%Y%m%dT%H%M%SZ"
+DEFAULT_RUN_ID = re.compile(r"^\d{8}T\d{6}Z$")
+
+
+def default_run_id() -> str:
+    """A new run id, the UTC time it starts at, so ids sort as runs start"""
+    return datetime.now(timezone.utc).strftime(RUN_ID_FORMAT)
+
+
+def latest_run(directory: Path) -> Optional[str]:
+    """The id of the last run that didn't finish, None when they all did
+
+    Finished runs clear their checkpoints, so every run left is unfinished.
+    """
+    if not directory.is_dir():
+        return None
+    return max((run.name for run in directory.iterdir() if run.is_dir()), default=None)
+
+
+def result_to_dict(result: CrawlResult) -> dict:
+    return {
+        "list": dataclasses.asdict(result.list),
+        "stats": dataclasses.asdict(result.stats),
+        "items": [
+            {**dataclasses.asdict(item.item), "time": item.time.isoformat()}
+            for item in result.items
+        ],
+    }
+
+
+def result_from_dict(data: dict) -> CrawlResult:
+    awesomeList = AwesomeList(**data["list"])
+    items = [
+        AwesomeItem(
+            ExtractInfo(i["name"], i["source"], i["description"], i["category"]),
+            awesomeList,
+            datetime.fromisoformat(i["time"]),
+        )
+        for i in data["items"]
+    ]
+    return CrawlResult(items, ListStats(**data["stats"]), awesomeList)
+
+
+class Checkpoint:
+    """The results of a run on local disk, one file per finished list
+
+    A run killed halfway is resumed by crawling only the lists without a
+    checkpoint, the finished ones are read back one at a time. Files are
+    written to a temporary name and renamed, so a run killed while writing
+    never leaves a partial result.
+    """
+
+    def __init__(self, directory: Path, run: str):
+        self.directory = directory
+        self.path = directory / run
+
+    def start(self, resume: bool):
+        """Keep this run's results when resuming, start it over otherwise
+
+        The checkpoints of other runs are never touched here, they may be
+        the ones a later run resumes.
+        """
+        if not resume:
+            shutil.rmtree(self.path, ignore_errors=True)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def result_path(self, awesomeList: AwesomeList) -> Path:
+        key = f"{awesomeList.name}\n{awesomeList.source}".encode()
+        return self.path / f"{hashlib.sha256(key).hexdigest()}.json"
+
+    def finished(self, awesomeList: AwesomeList) -> bool:
+        return self.result_path(awesomeList).exists()
+
+    def save(self, result: CrawlResult):
+        path = self.result_path(result.list)
+        temp = path.with_suffix(".tmp")
+        temp.write_text(json.dumps(result_to_dict(result)))
+        os.replace(temp, path)
+
+    def load(self, awesomeLists: Iterable[AwesomeList]) -> Iterator[CrawlResult]:
+        """The checkpointed results of `awesomeLists`, read as they are consumed"""
+        for awesomeList in awesomeLists:
+            yield result_from_dict(json.loads(self.result_path(awesomeList).read_text()))
+
+    def record(self, results: Iterable[CrawlResult]) -> Iterator[CrawlResult]:
+        """Save each result as it completes, before passing it on"""
+        for result in results:
+            self.save(result)
+            yield result
+
+    def clear(self):
+        """Forget the run once its output is written, and the runs before it
+
+        The lists of earlier unfinished runs were crawled again by this one,
+        so their checkpoints can't be resumed usefully anymore. Only runs
+        with default ids are known to be earlier, by sorting first; runs
+        given their own --run-id are left for whoever named them.
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+        for run in self.directory.iterdir():
+            if (
+                run.is_dir()
+                and DEFAULT_RUN_ID.match(run.name)
+                and run.name <= self.path.name
+            ):
+                shutil.rmtree(run, ignore_errors=True)
+
+
+def resume_crawl(
+    checkpoint: Checkpoint,
+    awesomeLists: list[AwesomeList],
+    crawl: Callable[[list[AwesomeList]], Iterable[CrawlResult]],
+) -> Iterator[CrawlResult]:
+    """The checkpointed results, then those of `crawl` over the other lists
+
+    `crawl` is called with the lists left to crawl and its results are
+    checkpointed as they complete.
+    """
+    finished: list[AwesomeList] = []
+    remaining: list[AwesomeList] = []
+    for repo in awesomeLists:
+        (finished if checkpoint.finished(repo) else remaining).append(repo)
+    if finished:
+        logger.info(f"resuming with {len(finished)} lists already crawled")
+    yield from checkpoint.load(finished)
+    yield from checkpoint.record(crawl(remaining))
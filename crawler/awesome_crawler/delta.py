@@ -1,40 +1,302 @@
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+from pathlib import Path
+from typing import Iterable, Optional
+import dataclasses
+import json
 import logging
 
 import boto3
+from botocore.exceptions import ClientError
 
-from awesome_crawler.serialize import Output, deserialize
+from awesome_crawler.serialize import (
+    LAYOUT_SHARDED,
+    Journal,
+    Manifest,
+    Output,
+    OutputList,
+    Shard,
+    codec_of,
+    decode,
+    deserialize,
+    deserialize_journal,
+    deserialize_manifest,
+    deserialize_shard,
+)
+from awesome_crawler.urls import AliasIndex
 
 logger = logging.getLogger(__name__)
 
+BUCKET = "awesome-crawler.allocsoc.net"
+SNAPSHOT_KEY = "data.json"
+JOURNAL_KEY = "journal.json"
+JOURNAL_PREFIX = "journal/"
+MANIFEST_KEY = "manifest.json"
+SHARD_PREFIX = "shards/"
+SHARD_WORKERS = 16
+# S3 objects are kept in this directory of the cache dir between runs
+S3_CACHE = "s3"
+CACHED_HEADERS = ("ETag", "ContentType", "ContentEncoding")
 
-def get_last() -> str:
+
+def fetch(client, key: str, cache_dir: Optional[Path] = None) -> tuple[bytes, dict]:
+    """The body of an S3 object and its headers
+
+    With `cache_dir` the object is kept there, and only downloaded again
+    when its ETag changed; otherwise S3 answers 304 without a body.
+    """
+    if cache_dir is None:
+        obj = client.get_object(Bucket=BUCKET, Key=key)
+        return obj["Body"].read(), obj
+
+    path = cache_dir / S3_CACHE / key
+    headers_path = path.with_name(f"{path.name}.headers")
+    cached = None
+    if path.exists() and headers_path.exists():
+        cached = json.loads(headers_path.read_text())
+
+    try:
+        if cached:
+            obj = client.get_object(Bucket=BUCKET, Key=key, IfNoneMatch=cached["ETag"])
+        else:
+            obj = client.get_object(Bucket=BUCKET, Key=key)
+    except ClientError as e:
+        if not cached or e.response["Error"]["Code"] not in ("304", "NotModified"):
+            raise
+        logger.info(f"{key} is unchanged, reading it from {path}")
+        return path.read_bytes(), cached
+
+    data = obj["Body"].read()
+    # the headers go last, so an interrupted write is downloaded again
+    path.parent.mkdir(parents=True, exist_ok=True)
+    headers_path.unlink(missing_ok=True)
+    path.write_bytes(data)
+    headers = {name: obj[name] for name in CACHED_HEADERS if name in obj}
+    headers_path.write_text(json.dumps(headers))
+    return data, obj
+
+
+def read_output(client, key: str, cache_dir: Optional[Path] = None) -> Output:
+    """An output stored on S3, decoded with the codec its metadata names"""
+    data, headers = fetch(client, key, cache_dir)
+    return decode(data, codec_of(headers))
+
+
+def get_last(client=None, cache_dir: Optional[Path] = None) -> Output:
     print("📥 Downloading data.json from S3...")
     logger.info("Fetching last data from S3")
     try:
-        print("🔗 Connecting to S3...")
-        client = boto3.client("s3")
-        logger.debug("Created S3 client successfully")
+        if client is None:
+            print("🔗 Connecting to S3...")
+            client = boto3.client("s3")
+            logger.debug("Created S3 client successfully")
         
         print("📂 Requesting data.json from awesome-crawler.allocsoc.net...")
-        obj = client.get_object(Bucket="awesome-crawler.allocsoc.net", Key="data.json")
-        
-        print("⏬ Downloading file content...")
-        data = obj["Body"].read()
+        data, headers = fetch(client, SNAPSHOT_KEY, cache_dir)
         
         data_size_mb = len(data) / (1024 * 1024)
-        print(f"✅ Successfully downloaded {data_size_mb:.1f}MB from S3")
+        print(f"✅ Successfully read {data_size_mb:.1f}MB from S3 ({codec_of(headers)})")
         logger.info(f"Successfully fetched {len(data)} bytes from S3")
-        return data
+        return decode(data, codec_of(headers))
     except Exception as e:
         print(f"❌ Failed to download data.json: {e}")
         logger.error(f"Failed to fetch last data from S3: {e}")
         raise
 
 
-def find_list(list, name):
-    p = [x for x in list if x.name == name]
-    return p[0] if p else None
+def read_journal(client) -> Journal:
+    """The journal of runs since the snapshot, empty before the first one"""
+    try:
+        obj = client.get_object(Bucket=BUCKET, Key=JOURNAL_KEY)
+    except client.exceptions.NoSuchKey:
+        return Journal("", [])
+    return deserialize_journal(obj["Body"].read())
+
+
+def read_manifest(client) -> Manifest:
+    """The shards of the sharded snapshot, empty when there is none"""
+    try:
+        obj = client.get_object(Bucket=BUCKET, Key=MANIFEST_KEY)
+    except client.exceptions.NoSuchKey:
+        return Manifest([])
+    return deserialize_manifest(obj["Body"].read())
+
+
+def load_shards(
+    client, manifest: Manifest, cache_dir: Optional[Path] = None
+) -> Output:
+    """Download the shards of the manifest in parallel, keeping their order
+
+    Shards are stored under the hash of their content, so with `cache_dir`
+    the ones already there are read without asking S3, and only the missing
+    ones are downloaded. Shards the manifest no longer lists are removed.
+    """
+
+    def load(shard: Shard) -> OutputList:
+        data = cached_shard(cache_dir, shard)
+        if data is None:
+            data, _ = fetch(client, shard.key, cache_dir)
+        return deserialize_shard(data)
+
+    missing = [s for s in manifest.shards if cached_shard(cache_dir, s) is None]
+    print(f"📦 Downloading {len(missing)} of {len(manifest.shards)} shards...")
+    with ThreadPoolExecutor(SHARD_WORKERS) as executor:
+        lists = list(executor.map(load, manifest.shards))
+
+    if cache_dir is not None:
+        wanted = {shard.key for shard in manifest.shards}
+        for path in (cache_dir / S3_CACHE / SHARD_PREFIX).glob("*"):
+            key = SHARD_PREFIX + path.name.removesuffix(".headers")
+            if key not in wanted:
+                path.unlink(missing_ok=True)
+    return Output(lists)
+
+
+def cached_shard(cache_dir: Optional[Path], shard: Shard) -> Optional[bytes]:
+    """The shard as `fetch` cached it, None when it isn't complete on disk"""
+    if cache_dir is None:
+        return None
+    path = cache_dir / S3_CACHE / shard.key
+    if not path.with_name(f"{path.name}.headers").exists():
+        return None
+    return path.read_bytes()
+
+
+def load_current(cache_dir: Optional[Path] = None) -> Output:
+    """The current data: the snapshot with the journal entries applied
+
+    The journal is read first and says how the snapshot is stored. Entries
+    are merged like any new crawl, so applying one the snapshot already
+    contains changes nothing. With `cache_dir` the snapshot and entries are
+    only downloaded when they changed since the last run, see `fetch`.
+    """
+    client = boto3.client("s3")
+    journal = read_journal(client)
+    if journal.layout == LAYOUT_SHARDED:
+        snapshot = load_shards(client, read_manifest(client), cache_dir)
+    else:
+        snapshot = get_last(client, cache_dir)
+    print(f"📜 Applying {len(journal.entries)} journal entries...")
+    entries = (read_output(client, key, cache_dir) for key in journal.entries)
+    return reconstruct(snapshot, entries)
+
+
+def reconstruct(snapshot: Output, entries: Iterable[Output]) -> Output:
+    return reduce(merge_outputs, entries, snapshot)
+
+
+def index_by_name(lists: list[OutputList]) -> dict[str, OutputList]:
+    """Lists by name, the first one wins when a name is repeated"""
+    indexed: dict[str, OutputList] = {}
+    for output_list in lists:
+        indexed.setdefault(output_list.name, output_list)
+    return indexed
+
+
+class ListIndex:
+    """Previous lists by name, and by repository for the first of each
+
+    A crawled list matches the previous list with its name, or else the one
+    stored for the same repository under another name, see
+    `AliasIndex.resolve`.
+    """
+
+    def __init__(self, lists: list[OutputList], aliases: Optional[AliasIndex] = None):
+        self.aliases = aliases or AliasIndex()
+        self.by_name = index_by_name(lists)
+        self.by_repository: dict[str, OutputList] = {}
+        for output_list in self.by_name.values():
+            repository = self.aliases.resolve(output_list.source)
+            if repository:
+                self.by_repository.setdefault(repository, output_list)
+
+    def get(self, new_list: OutputList) -> Optional[OutputList]:
+        found = self.by_name.get(new_list.name)
+        if found is None:
+            repository = self.aliases.resolve(new_list.source)
+            found = self.by_repository.get(repository) if repository else None
+        return found
+
+    def pop(self, new_list: OutputList) -> Optional[OutputList]:
+        found = self.get(new_list)
+        if found is not None:
+            del self.by_name[found.name]
+            repository = self.aliases.resolve(found.source)
+            if repository and self.by_repository.get(repository) is found:
+                del self.by_repository[repository]
+        return found
+
+    def values(self) -> Iterable[OutputList]:
+        return self.by_name.values()
+
+
+def merge_list(old_list: Optional[OutputList], new_list: OutputList) -> OutputList:
+    """The old list with the new items it didn't have, or the new list"""
+    added = added_items(old_list, new_list)
+    if old_list is None or added is None:
+        return new_list if old_list is None else old_list
+
+    return dataclasses.replace(old_list, items=old_list.items + added.items)
+
+
+def added_items(
+    old_list: Optional[OutputList], new_list: OutputList
+) -> Optional[OutputList]:
+    """The part of `new_list` that `merge_list` adds, None when nothing is new"""
+    if old_list is None:
+        logger.info(f"Adding new list '{new_list.name}' with {len(new_list.items)} items")
+        return new_list
+
+    names = {item.name for item in old_list.items}
+    to_append = [item for item in new_list.items if item.name not in names]
+    if not to_append:
+        return None
+
+    logger.info(f"List '{old_list.name}': adding {len(to_append)} new items")
+    return dataclasses.replace(old_list, items=to_append)
+
+
+def merge_outputs(
+    old: Output, new: Output, aliases: Optional[AliasIndex] = None
+) -> Output:
+    """The old lists with their new items, followed by the lists that are new
+
+    Lists and items are matched by name through dicts and sets, and neither
+    output is modified. A new list with a name the old output doesn't have
+    is merged into the list of the same repository, when there is one.
+    """
+    aliases = aliases or AliasIndex()
+    new_by_name = index_by_name(new.lists)
+    lists = []
+    for old_list in old.lists:
+        new_list = new_by_name.get(old_list.name)
+        lists.append(merge_list(old_list, new_list) if new_list else old_list)
+
+    names = {output_list.name for output_list in lists}
+    positions: dict[str, int] = {}
+    for position, output_list in enumerate(lists):
+        repository = aliases.resolve(output_list.source)
+        if repository:
+            positions.setdefault(repository, position)
+
+    for new_list in new.lists:
+        if new_list.name in names:
+            continue
+        names.add(new_list.name)
+        repository = aliases.resolve(new_list.source)
+        found = positions.get(repository) if repository else None
+        if found is not None:
+            lists[found] = merge_list(lists[found], new_list)
+            continue
+        if repository:
+            positions[repository] = len(lists)
+        lists.append(merge_list(None, new_list))
+
+    return Output(lists)
+
+
+def count_items(output: Output) -> int:
+    return sum(len(output_list.items) for output_list in output.lists)
 
 
 def delta(new_data: str, old_data: Optional[str] = None) -> Output:
@@ -45,61 +307,22 @@ def delta(new_data: str, old_data: Optional[str] = None) -> Output:
         new: Output = deserialize(new_data)
         logger.info(f"New data contains {len(new.lists)} lists")
         
+        old: Output
         if old_data:
             logger.debug("Using provided old data")
-            old: Output = deserialize(old_data)
+            old = deserialize(old_data)
         else:
-            logger.debug("Fetching old data from S3")
-            old: Output = deserialize(get_last())
+            logger.debug("Fetching current data from S3")
+            old = load_current()
         
         logger.info(f"Old data contains {len(old.lists)} lists")
-        
-        lists = []
-        total_items_added = 0
-
-        logger.debug("Processing existing lists for delta changes")
-        for old_list in old.lists:
-            new_list = find_list(new.lists, old_list.name)
-            f = []
-            to_append = []
-            
-            if new_list:
-                logger.debug(f"Processing list '{old_list.name}' - old: {len(old_list.items)} items, new: {len(new_list.items)} items")
-                
-                for old_item in old_list.items:
-                    new_item = find_list(new_list.items, old_item.name)
-
-                    if new_item:
-                        f.append(new_item.name)
-
-                to_append = [item for item in new_list.items if item.name not in f]
-                
-                if to_append:
-                    logger.info(f"List '{old_list.name}': adding {len(to_append)} new items")
-                    for item in to_append:
-                        logger.debug(f"  - Adding item: {item.name}")
-                    total_items_added += len(to_append)
-                else:
-                    logger.debug(f"List '{old_list.name}': no new items to add")
-            else:
-                logger.debug(f"List '{old_list.name}' not found in new data")
-            
-            old_list.items = old_list.items + to_append
-            lists.append(old_list)
-
-        logger.debug("Processing completely new lists")
-        new_lists_added = 0
-        for new_list in new.lists:
-            old_list = find_list(lists, new_list.name)
-
-            if not old_list:
-                logger.info(f"Adding new list '{new_list.name}' with {len(new_list.items)} items")
-                lists.append(new_list)
-                new_lists_added += 1
-                total_items_added += len(new_list.items)
 
+        merged = merge_outputs(old, new)
+
+        new_lists_added = len(merged.lists) - len(old.lists)
+        total_items_added = count_items(merged) - count_items(old)
         logger.info(f"Delta calculation complete: {new_lists_added} new lists, {total_items_added} total new items added")
-        return Output(lists)
+        return merged
         
     except Exception as e:
         logger.error(f"Error during delta calculation: {e}")
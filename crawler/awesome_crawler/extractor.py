@@ -1,11 +1,47 @@
 import logging
+import re
 from dataclasses import dataclass
-from typing import Mapping, Optional
+from functools import lru_cache
+from typing import Callable, Mapping, Optional
 
 import mistune
 
 logger = logging.getLogger(__name__)
 
+ENGINE_AST = "ast"
+ENGINE_FAST = "fast"
+ENGINES = (ENGINE_AST, ENGINE_FAST)
+
+# "- [Name](url) - description" where the description has at most code spans
+PLAIN = r"[^\[\]\\`*_<>!&]"
+CODE_SPAN = r"`[^`]*[^`\s][^`]*`"
+FAST_ITEM = re.compile(
+    rf"^[-*+] \[(?P<name>{PLAIN}+)\]\((?P<url>[^\s()<>\\\"]+)\)"
+    rf"(?P<description>(?:{PLAIN}|{CODE_SPAN})*)(?<!\s)$"
+)
+CODE_SPAN_SPLIT = re.compile(r"`([^`]+)`")
+SPACES = re.compile(r" +")
+SAFE_URL = re.compile(r"[\w/#:()*?=%@+,.~-]*", re.ASCII)
+ITEM_MARKER = re.compile(r"^[\s>]*(?:[-*+]|\d+[.)])(?:\s|$)")
+LIST_ITEM_LINE = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s")
+TOP_LEVEL_ITEM_LINE = re.compile(r"^(?:[-*+]|\d+[.)])\s")
+HEADING = re.compile(r"^ {0,3}#{1,6}(?:[ \t]+(?P<title>.*?))?(?:[ \t]+#+)?[ \t]*$")
+FENCE = re.compile(r"^ {0,3}(?P<fence>`{3,}|~{3,})")
+HTML_BLOCK = re.compile(r"^ {0,3}<(?P<tag>!--|[a-zA-Z]*)")
+HTML_BLOCK_END = {
+    "!--": "-->",
+    "script": "</script>",
+    "pre": "</pre>",
+    "style": "</style>",
+    "textarea": "</textarea>",
+}
+CHUNK_MARKER = "awesome-crawler-fallback-chunk"
+LINK_DEFINITION = re.compile(r"^ {0,3}\[[^\]]+\]:")
+
+
+class FastExtractError(Exception):
+    """The fast extractor can't tell how mistune reads a part of the document"""
+
 
 @dataclass
 class ExtractInfo:
@@ -15,73 +51,391 @@ class ExtractInfo:
     category: Optional[str]
 
 
-def extract(source: str) -> list[ExtractInfo]:
-    markdown = mistune.create_markdown(renderer="ast")
-    ast: Mapping[str, str] = markdown(source)
+@lru_cache(maxsize=None)
+def markdown_parser() -> mistune.Markdown:
+    """The AST markdown parser, built once per process"""
+    return mistune.create_markdown(renderer="ast")
 
-    list_items = find_list_items(ast)
-    items_info = map(map_list_item, list_items)
-    return list(filter(None, items_info))
 
+def extract(source: str, engine: str = ENGINE_AST) -> list[ExtractInfo]:
+    if engine == ENGINE_FAST:
+        return extract_fast(source)
+    if engine != ENGINE_AST:
+        raise ValueError(f"unknown extractor engine {engine}")
 
-def find_list_items(ast):
-    def is_listitem(token):
-        return "type" in token and token["type"] == "list_item"
+    ast: Mapping[str, str] = markdown_parser()(source)
+    return extract_ast(ast)
 
-    return filter(is_listitem, flat(ast))
 
+def extract_fast(source: str) -> list[ExtractInfo]:
+    """Extract list items line by line, using mistune only where needed
 
-def map_list_item(list_item) -> Optional[ExtractInfo]:
-    list_item = [list_item]
-    block_text = find_type_single(list_item, "block_text")
-    if block_text is None:
-        block_text = list_item[0]
+    Lines following the `- [Name](url) - description` convention are matched
+    with a regex, everything else (code, html, nested or multi-line items,
+    inline formatting, ...) is collected into chunks that go through the AST
+    extractor. Documents with reference links are parsed whole, as their
+    definitions can be anywhere. The items of both paths are the same, and
+    carry the heading they are listed under as their category.
+    """
+    lines = source.splitlines()
+    if any(LINK_DEFINITION.match(line) for line in lines):
+        return extract_sections(source)
 
-    if "children" not in block_text:
-        return None
+    items: list[ExtractInfo] = []
+    chunks: list[Chunk] = []
+    fallback = Chunk(None, None, [])
+    category: Optional[str] = None
+    previous_item: Optional[int] = None
+    scanner = BlockScanner()
+    blocks: set[int] = set()
 
-    link_token = find_type_single(get_children(block_text), "link")
-    if link_token is None:
-        logger.warn(f"no link found... ignoring this item {list_item}")
-        return None
+    for index, line in enumerate(lines):
+        if scanner.in_block(line):
+            fallback.lines.append(line)
+            blocks.add(index)
+            continue
+
+        heading = HEADING.match(line)
+        match = None if heading else FAST_ITEM.match(line)
+        if match and not is_standalone_item(lines, index):
+            match = None
+
+        if (heading or match) and fallback.lines:
+            if match:
+                fallback.next_item = index
+            chunks.append(fallback)
+
+        if heading:
+            category = heading.group("title") or None
+            previous_item = None
+            fallback = Chunk(category, previous_item, [])
+        elif match:
+            item = fast_item(match, category)
+            if item:
+                items.append(item)
+            previous_item = index
+            fallback = Chunk(category, previous_item, [])
+        else:
+            fallback.lines.append(line)
+
+    if fallback.lines:
+        chunks.append(fallback)
+
+    try:
+        return items + extract_chunks(lines, blocks, chunks)
+    except FastExtractError as e:
+        logger.warning(f"parsing the whole document instead: {e}")
+        return extract_sections(source)
+
+
+def compat():
+    """The mistune internals of the fast extractor, imported on first use
+
+    Importing them fails on mistune versions they weren't written against,
+    which should only break the fast engine, not the AST one.
+    """
+    from awesome_crawler import mistune_compat
+
+    return mistune_compat
+
+
+class BlockScanner:
+    """Follows the code fences and html blocks of a document line by line
 
-    name = get_text([link_token])
-    link: str = link_token["link"]
+    Their lines are never headings or list items, however they look.
+    """
+
+    def __init__(self):
+        self.fence: Optional[str] = None
+        self.html_end: Optional[str] = None
+
+    def in_block(self, line: str) -> bool:
+        """Whether `line` opens, continues or closes a code or html block"""
+        if self.fence:
+            if line.strip().startswith(self.fence):
+                self.fence = None
+            return True
+
+        if self.html_end is not None:
+            if self.html_end in line if self.html_end else not line.strip():
+                self.html_end = None
+            return True
+
+        opening = FENCE.match(line)
+        if opening:
+            self.fence = opening.group("fence")
+            return True
+
+        html = HTML_BLOCK.match(line)
+        if html:
+            self.html_end = HTML_BLOCK_END.get(html.group("tag").lower(), "")
+            if self.html_end and self.html_end in line[html.end() :]:
+                self.html_end = None
+            return True
+
+        return False
+
+
+def extract_sections(source: str) -> list[ExtractInfo]:
+    """Extract a whole document, with the heading of each item as its category
+
+    Only top level headings start a section, as in the fast extractor.
+    """
+    sections: list[tuple[Optional[str], list]] = [(None, [])]
+    for token in markdown_parser()(source):
+        if token.get("type") == "heading":
+            sections.append((plain_text(token["children"]) or None, []))
+        else:
+            sections[-1][1].append(token)
+
+    items = []
+    for category, tokens in sections:
+        for item in extract_ast(tokens):
+            item.category = category
+            items.append(item)
+    return items
+
+
+def plain_text(tokens: list) -> str:
+    """The text of inline tokens, without their markup"""
+    return "".join(
+        token["text"] if "text" in token else plain_text(token.get("children") or [])
+        for token in tokens
+    )
+
+
+@dataclass
+class Chunk:
+    """Consecutive lines the fast extractor leaves to the AST extractor
+
+    `previous_item` and `next_item` are the indexes of the fast list items
+    right before and after the chunk, as its lines may continue their list.
+    """
+
+    category: Optional[str]
+    previous_item: Optional[int]
+    lines: list[str]
+    next_item: Optional[int] = None
 
+
+def extract_chunks(
+    lines: list[str], blocks: set[int], chunks: list[Chunk]
+) -> list[ExtractInfo]:
+    """Extract the fallback chunks of a document with a single parse
+
+    The chunks are joined as one document with a marker heading before each,
+    headings end every other block so they are parsed as if they were alone.
+    The fast items around a chunk are replaced by placeholder items, so lists
+    continue as they do in the document, and are dropped after parsing.
+    """
+    chunks = [
+        chunk
+        for chunk in chunks
+        if any(ITEM_MARKER.match(line) for line in chunk.lines)
+    ]
+    if not chunks:
+        return []
+
+    is_tight = list_tightness(lines, blocks)
+    parts = []
+    for chunk in chunks:
+        # whether a list is loose only matters to items with nested blocks
+        nested = any(line[:1].isspace() and line.strip() for line in chunk.lines)
+        parts.append(f"# {CHUNK_MARKER}\n")
+        if chunk.previous_item is not None:
+            tight = not nested or is_tight(chunk.previous_item)
+            parts.append(placeholder(lines, chunk.previous_item))
+            parts.extend([] if tight else [""])
+        parts.extend(chunk.lines)
+        if chunk.next_item is not None:
+            tight = not nested or is_tight(chunk.next_item)
+            parts.extend([] if tight else [""])
+            parts.append(placeholder(lines, chunk.next_item))
+        parts.append("")
+
+    groups: list[list] = []
+    for token in markdown_parser()("\n".join(parts)):
+        if is_chunk_marker(token):
+            groups.append([])
+            continue
+        if token.get("type") == "list":
+            children = [
+                child for child in token["children"] if not is_chunk_marker(child)
+            ]
+            token = dict(token, children=children)
+        groups[-1].append(token)
+
+    items = []
+    for chunk, tokens in zip(chunks, groups):
+        for item in extract_ast(tokens):
+            item.category = chunk.category
+            items.append(item)
+    return items
+
+
+def placeholder(lines: list[str], index: int) -> str:
+    """A list item standing in for the fast item at `index`"""
+    return f"{lines[index][0]} {CHUNK_MARKER}"
+
+
+def list_tightness(lines: list[str], blocks: set[int]) -> Callable[[int], bool]:
+    """Whether the list of a top level item is tight, found as mistune does
+
+    Lists can't start in the code and html `blocks`, but their indented lines
+    can continue one. The lists are only looked for on the first call, as
+    most documents never need them.
+    """
+    starts: list[int] = []
+    tightness: dict[int, bool] = {}
+
+    def find_starts():
+        list_start = compat().list_start
+        start: Optional[int] = None
+        marker = ""
+        for index, line in enumerate(lines):
+            item = list_start(line)
+            if start is not None and (not line.strip() or line[:1].isspace()):
+                pass
+            elif not item or index in blocks:
+                start = None
+            elif start is None or marker != item.group(2)[-1]:
+                start, marker = index, item.group(2)[-1]
+            starts.append(-1 if start is None else start)
+
+    def is_tight(index: int) -> bool:
+        if not starts:
+            find_starts()
+        start = starts[index]
+        if start not in tightness:
+            end = start + 1
+            while end < len(lines) and starts[end] == start:
+                end += 1
+            found = compat().list_items("\n".join(lines[start:end]))
+            if found is None:
+                raise FastExtractError(f"no list starts at line {start}")
+            tightness[start] = "\n\n" not in "".join(found).strip()
+        return tightness[start]
+
+    return is_tight
+
+
+def is_chunk_marker(token) -> bool:
+    """Whether `token` is a marker heading or placeholder item of extract_chunks"""
+    children = token.get("children")
+    if token.get("type") == "list_item" and children:
+        children = children[0].get("children")
+    return children == [{"type": "text", "text": CHUNK_MARKER}] and (
+        token.get("type") in ("heading", "list_item")
+    )
+
+
+def is_standalone_item(lines: list[str], index: int) -> bool:
+    """Whether the list item at `index` can't share tokens with its neighbours"""
+    previous = lines[index - 1] if index > 0 else ""
+    if previous.strip() and not (
+        LIST_ITEM_LINE.match(previous) or HEADING.match(previous)
+    ):
+        return False
+
+    following = index + 1
+    if following < len(lines) and lines[following].strip():
+        line = lines[following]
+        return bool(TOP_LEVEL_ITEM_LINE.match(line) or HEADING.match(line))
+
+    # after blank lines, indented lines would still belong to this item
+    while following < len(lines) and not lines[following].strip():
+        following += 1
+    return following == len(lines) or not lines[following][0].isspace()
+
+
+def fast_item(match: re.Match, category: Optional[str]) -> Optional[ExtractInfo]:
+    link = match.group("url")
+    if not SAFE_URL.fullmatch(link):
+        link = compat().escape_url(link)
     if link.startswith("#"):
         return None
 
-    description = get_text(list_item)
-    return ExtractInfo(name, link, description, None)
+    # texts in the order the AST extractor joins them: last token first
+    name = match.group("name")
+    texts = CODE_SPAN_SPLIT.split(match.group("description"))
+    texts[1::2] = [SPACES.sub(" ", code.strip()) for code in texts[1::2]]
+    description = " ".join([text for text in reversed(texts) if text] + [name])
+    return ExtractInfo(name, link, description, category)
 
 
-def flat(ast):
-    queue = ast.copy()
-    while queue:
-        item = queue.pop()
+def extract_ast(ast) -> list[ExtractInfo]:
+    """Extract the list items of a mistune AST in a single traversal
 
-        if "children" in item and type(item["children"]) is list:
-            queue = queue + item["children"]
+    Tokens are flattened once in the order they were always visited (last
+    child first) together with where each subtree ends, so every lookup inside
+    a list item becomes a bounded scan of that flat list.
+    """
+    tokens, ends = flatten(ast)
+    next_block_text = next_of_type(tokens, "block_text")
+    next_link = next_of_type(tokens, "link")
 
-        yield item
+    items = []
+    for index, token in enumerate(tokens):
+        if token.get("type") != "list_item":
+            continue
 
+        block_text = next_block_text[index + 1]
+        if block_text >= ends[index]:
+            block_text = index
 
-def find_type_single(ast, type):
-    def is_type(token):
-        return token["type"] == type
+        if "children" not in tokens[block_text]:
+            continue
 
-    try:
-        return next(filter(is_type, flat(ast)))
-    except StopIteration:
-        return None
+        link = next_link[block_text + 1]
+        if link >= ends[block_text]:
+            logger.warning(f"no link found... ignoring this item {[token]}")
+            continue
 
+        name = get_text(tokens, link, ends[link])
+        href: str = tokens[link]["link"]
 
-def get_children(token):
-    if "children" in token:
-        return token["children"]
-    else:
-        return []
+        if href.startswith("#"):
+            continue
+
+        description = get_text(tokens, index, ends[index])
+        items.append(ExtractInfo(name, href, description, None))
+
+    return items
+
+
+def flatten(ast) -> tuple[list, list[int]]:
+    """Tokens in depth first order, last child first, and their subtree ends"""
+    tokens: list = []
+    ends: list[int] = []
+    stack: list = [(token, False) for token in ast]
+
+    while stack:
+        token, visited = stack.pop()
+        if visited:
+            ends[token] = len(tokens)
+            continue
+
+        stack.append((len(tokens), True))
+        tokens.append(token)
+        ends.append(0)
+
+        children = token.get("children")
+        if type(children) is list:
+            stack.extend((child, False) for child in children)
+
+    return tokens, ends
+
+
+def next_of_type(tokens: list, type: str) -> list[int]:
+    """For every position, the index of the first token of `type` at or after it"""
+    result = [len(tokens)] * (len(tokens) + 1)
+    for index in range(len(tokens) - 1, -1, -1):
+        is_type = tokens[index].get("type") == type
+        result[index] = index if is_type else result[index + 1]
+    return result
 
 
-def get_text(ast):
-    return " ".join([token["text"] for token in flat(ast) if "text" in token])
+def get_text(tokens: list, start: int, end: int) -> str:
+    return " ".join(
+        tokens[i]["text"] for i in range(start, end) if "text" in tokens[i]
+    )
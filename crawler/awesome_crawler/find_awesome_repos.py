@@ -1,42 +1,267 @@
+import dataclasses
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlencode
 
-from github import Github
+import requests
+from requests.adapters import HTTPAdapter
 
-from awesome_crawler.awesome_repo import process_awesome_repo
-from awesome_crawler.process import AwesomeList
+from awesome_crawler.awesome_repo import process_awesome_repo, remote_head
+from awesome_crawler.delta import ListIndex
+from awesome_crawler.process import PROBE_TIMEOUT, AwesomeList
+from awesome_crawler.serialize import Output, OutputList
+from awesome_crawler.urls import AliasIndex, resolve_redirects
 
+logger = logging.getLogger(__name__)
+
+SEARCH_URL = "https://api.github.com/search/repositories"
+TOPIC_QUERY = "topic:awesome-list"
+# the search API returns at most this many results for a query
+SEARCH_CAP = 1000
+PER_PAGE = 100
+DISCOVERY_WORKERS = 4
+# no repository was created before GitHub launched
+FIRST_CREATED = date(2008, 1, 1)
+AWESOME_AWESOME = "https://github.com/sindresorhus/awesome"
+# discovery results are kept in this directory of the cache dir between runs
+DISCOVERY_CACHE = "discovery"
+
+
+class HttpCache:
+    """Response bodies by URL with their ETag, kept on disk between runs"""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, url: str) -> Path:
+        return self.directory / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+    def get(self, url: str) -> Optional[dict]:
+        """The cached `etag` and `body` of `url`, None when there are none"""
+        path = self.path(url)
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+    def put(self, url: str, etag: str, body):
+        path = self.path(url)
+        temp = path.with_suffix(".tmp")
+        temp.write_text(json.dumps({"etag": etag, "body": body}))
+        temp.replace(path)
+
+
+class RateLimit:
+    """The search rate limit, shared by the threads of a discovery run
+
+    It is updated from the X-RateLimit headers of every response; once no
+    request is left, requests wait until GitHub resets the limit.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.remaining: Optional[int] = None
+        self.reset = 0.0
+
+    def acquire(self):
+        with self.lock:
+            if self.remaining is not None and self.remaining <= 0:
+                delay = max(self.reset - time.time(), 0) + 1
+                logger.info(f"search rate limit exhausted, waiting {delay:.0f}s")
+                time.sleep(delay)
+                self.remaining = None
+            elif self.remaining is not None:
+                self.remaining -= 1
+
+    def update(self, response: requests.Response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        retry_after = response.headers.get("Retry-After")
+        with self.lock:
+            if remaining is not None:
+                self.remaining = int(remaining)
+            if reset is not None:
+                self.reset = float(reset)
+            if retry_after is not None:
+                self.remaining = 0
+                self.reset = time.time() + float(retry_after)
+
+
+class GithubSearch:
+    """Repository search split into queries under the result cap
+
+    Pages are fetched concurrently through one connection pool, paced by
+    the shared `RateLimit`. A token in GITHUB_TOKEN raises the limit. With
+    a `cache`, pages are requested with the ETag they had last time and
+    unchanged ones come back as a 304 without a body.
+    """
+
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        workers: int = DISCOVERY_WORKERS,
+        cache: Optional[HttpCache] = None,
+    ):
+        self.workers = workers
+        self.cache = cache
+        self.rate_limit = RateLimit()
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=workers))
+        self.session.headers["Accept"] = "application/vnd.github+json"
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def get(self, query: str, page: int = 1) -> dict:
+        """One page of results, retried after the rate limit resets"""
+        params = {"q": query, "per_page": PER_PAGE, "page": page}
+        url = f"{SEARCH_URL}?{urlencode(params)}"
+        cached = self.cache.get(url) if self.cache else None
+        headers = {"If-None-Match": cached["etag"]} if cached else {}
+        while True:
+            self.rate_limit.acquire()
+            response = self.session.get(url, headers=headers, timeout=30)
+            self.rate_limit.update(response)
+            if response.status_code in (403, 429) and self.rate_limit.remaining == 0:
+                continue
+            if response.status_code == 304 and cached:
+                return cached["body"]
+            response.raise_for_status()
+            body = response.json()
+            if self.cache and "ETag" in response.headers:
+                self.cache.put(url, response.headers["ETag"], body)
+            return body
+
+    def shards(self, query: str, start: date, end: date) -> list[tuple[str, dict]]:
+        """Queries for the repositories created between `start` and `end`
+
+        Ranges with more results than the search returns are halved until
+        they fit. Each query comes with its first page.
+        """
+        ranged = f"{query} created:{start.isoformat()}..{end.isoformat()}"
+        first = self.get(ranged)
+        if first["total_count"] <= SEARCH_CAP or start >= end:
+            return [(ranged, first)]
+        middle = start + (end - start) / 2
+        return self.shards(query, start, middle) + self.shards(
+            query, middle + timedelta(days=1), end
+        )
+
+    def search(self, query: str) -> list[dict]:
+        """Every repository matching `query`, each once
+
+        The date ranges end with the year, so that the queries, and their
+        cached pages, stay the same from one run to the next.
+        """
+        shards = self.shards(query, FIRST_CREATED, date(date.today().year, 12, 31))
+        pages = [
+            (ranged, page)
+            for ranged, first in shards
+            for page in range(2, math.ceil(min(first["total_count"], SEARCH_CAP) / PER_PAGE) + 1)
+        ]
+        logger.info(f"searching {query} in {len(shards)} queries, {len(shards) + len(pages)} pages")
+        with ThreadPoolExecutor(self.workers) as executor:
+            rest = list(executor.map(lambda args: self.get(*args), pages))
+
+        repos: dict[int, dict] = {}
+        for result in [first for _, first in shards] + rest:
+            for item in result["items"]:
+                repos.setdefault(item["id"], item)
+        return list(repos.values())
+
+
+def from_awesome_awesome(cache_dir: Optional[Path] = None):
+    """The lists of sindresorhus/awesome
+
+    With `cache_dir` they are kept there with the SHA they were read at,
+    and reused as long as the remote HEAD hasn't moved.
+    """
+    path = cache_dir / DISCOVERY_CACHE / "awesome-awesome.json" if cache_dir else None
+    head = remote_head(AWESOME_AWESOME, PROBE_TIMEOUT) if path else None
+    if path and path.exists():
+        cached = json.loads(path.read_text())
+        if cached["head"] == head:
+            logger.info(f"{AWESOME_AWESOME} is still at {head}, reusing its lists")
+            return [AwesomeList(**repo) for repo in cached["lists"]]
 
-def from_awesome_awesome():
     list_of_awesome_projects = [
         AwesomeList(p.item.name, p.item.source, p.item.description)
-        for p in process_awesome_repo("https://github.com/sindresorhus/awesome", 1)
+        for p in process_awesome_repo(AWESOME_AWESOME, 1)
     ]
 
+    if path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lists = [dataclasses.asdict(repo) for repo in list_of_awesome_projects]
+        path.write_text(json.dumps({"head": head, "lists": lists}))
     return list_of_awesome_projects
 
 
-def from_github_topics():
-    g = Github(per_page=100)
-
-    paginated = g.search_repositories("topic:awesome-list")
-    lists = []
-    for i, repo in enumerate(paginated):
-        r = AwesomeList(repo.name, repo.html_url, repo.description)
-        print(r, i)
-        lists.append(r)
-        if i % 100 == 0:
-            time.sleep(6)
+def from_github_topics(cache_dir: Optional[Path] = None):
+    cache = HttpCache(cache_dir / DISCOVERY_CACHE / "http") if cache_dir else None
+    search = GithubSearch(os.environ.get("GITHUB_TOKEN"), cache=cache)
+    lists = [
+        AwesomeList(repo["name"], repo["html_url"], repo["description"])
+        for repo in search.search(TOPIC_QUERY)
+    ]
+    print(f"Found {len(lists)} repositories with the awesome-list topic")
     return lists
 
 
-def find_repos():
-    awesome_awesome = from_awesome_awesome()
-    github_topics = from_github_topics()
+def unique_repositories(
+    repos: list[AwesomeList], aliases: AliasIndex
+) -> list[AwesomeList]:
+    """The first list of each repository, with its canonical URL as source
+
+    Lists without a canonical URL are kept as they are.
+    """
+    unique = []
+    seen = set()
+    for repo in repos:
+        url = aliases.resolve(repo.source)
+        if url is None:
+            unique.append(repo)
+        elif url not in seen:
+            seen.add(url)
+            unique.append(dataclasses.replace(repo, source=url))
+    return unique
+
+
+def stored_names(
+    repos: list[AwesomeList], output: Output, aliases: AliasIndex
+) -> list[AwesomeList]:
+    """Lists already stored under another name keep that name
+
+    This way stats, scheduling and the delta all see a renamed repository
+    as the list it was before. Stored lists that `repos` doesn't have may
+    have been renamed since, so their redirects are resolved first.
+    """
+    discovered = {aliases.resolve(repo.source) for repo in repos}
+    missing = [lst.source for lst in output.lists if aliases.resolve(lst.source) not in discovered]
+    resolve_redirects(missing, aliases)
+    stored = ListIndex(output.lists, aliases)
+    named = []
+    for repo in repos:
+        found = stored.get(OutputList(repo.name, repo.source, repo.description, []))
+        named.append(dataclasses.replace(repo, name=found.name) if found else repo)
+    return named
 
-    duplicated_urls = set([r.source.strip().replace("#readme", "") for r in awesome_awesome]) & set([r.source.strip() for r in github_topics])
-    github_topics = list(filter(lambda r: r.source not in duplicated_urls, github_topics))
 
-    repos = awesome_awesome + github_topics
-    # repos = awesome_awesome[0:20]
+def find_repos(cache_dir: Optional[Path] = None, aliases: Optional[AliasIndex] = None):
+    """Every awesome list once, the ones in awesome-awesome first
 
-    return repos
+    Renamed GitHub repositories are added to `aliases` as they are found.
+    Only the links of awesome-awesome can be out of date, search results
+    have the current URL of each repository.
+    """
+    aliases = aliases if aliases is not None else AliasIndex()
+    awesome_awesome = from_awesome_awesome(cache_dir)
+    resolve_redirects([repo.source for repo in awesome_awesome], aliases)
+    return unique_repositories(awesome_awesome + from_github_topics(cache_dir), aliases)
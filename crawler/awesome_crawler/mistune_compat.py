@@ -0,0 +1,40 @@
+"""The mistune internals the fast extractor relies on, in one place
+
+The fast extractor has to find lists and escape urls exactly as the AST
+extractor does, which mistune only does in private helpers. They are used
+with the version they were written against only, so a mistune bump fails
+on import rather than quietly extracting different items.
+"""
+import re
+from typing import Optional
+
+import mistune
+
+SUPPORTED_VERSION = "2.0.0rc1"
+
+if mistune.__version__ != SUPPORTED_VERSION:
+    raise ImportError(
+        f"the fast extractor relies on mistune {SUPPORTED_VERSION} internals, "
+        f"found mistune {mistune.__version__}"
+    )
+
+from mistune.block_parser import BlockParser, _find_list_items  # noqa: E402
+from mistune.markdown import preprocess  # noqa: E402
+from mistune.scanner import escape_url  # noqa: E402
+
+__all__ = ["escape_url", "list_items", "list_start"]
+
+
+def list_start(line: str) -> Optional[re.Match]:
+    """Whether `line` starts a list, with its marker as the second group"""
+    return BlockParser.LIST_START.match(line + "\n")
+
+
+def list_items(text: str) -> Optional[list[str]]:
+    """The raw items of the list `text` starts with, None when it starts none"""
+    text, _ = preprocess(text, {})
+    start = BlockParser.LIST_START.match(text)
+    if not start:
+        return None
+    found, _ = _find_list_items(text, 0, start.group(1), start.group(2))
+    return found
@@ -1,16 +1,72 @@
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass
+from datetime import datetime, timezone
 from itertools import groupby
 from pathlib import Path
+from typing import IO, BinaryIO, Iterable, Iterator, Optional, Union, cast
+import io
 import logging
 
 import boto3
 import requests
 
-from awesome_crawler.delta import delta
+from awesome_crawler.delta import (
+    BUCKET,
+    JOURNAL_KEY,
+    JOURNAL_PREFIX,
+    MANIFEST_KEY,
+    SHARD_PREFIX,
+    SNAPSHOT_KEY,
+    ListIndex,
+    added_items,
+    load_current,
+    merge_list,
+    merge_outputs,
+    read_journal,
+    read_manifest,
+)
 from awesome_crawler.process import AwesomeItem, AwesomeList
-from awesome_crawler.serialize import Output, OutputItem, OutputList, serialize
+from awesome_crawler.urls import AliasIndex
+from awesome_crawler.serialize import (
+    CODEC_JSON,
+    LAYOUT_MONOLITHIC,
+    LAYOUT_SHARDED,
+    Journal,
+    Manifest,
+    Output,
+    OutputItem,
+    OutputList,
+    Shard,
+    content_headers,
+    encode,
+    encode_stream,
+    serialize,
+    serialize_journal,
+    serialize_manifest,
+    serialize_shard,
+    serialize_stream,
+)
 
 logger = logging.getLogger(__name__)
 
+# journal entries kept before they are compacted into the snapshot
+COMPACT_EVERY = 7
+# S3 needs multipart parts of at least 5MB, except for the last one
+PART_SIZE = 8 * 1024 * 1024
+UPLOAD_WORKERS = 4
+
+
+@dataclass(frozen=True)
+class UploadConfig:
+    part_size: int = PART_SIZE
+    workers: int = UPLOAD_WORKERS
+
 
 def generate_json_str(awesomeItems: list[AwesomeItem]) -> str:
     awesomeItems.sort(key=lambda item: item.list.name)
@@ -18,46 +74,106 @@ def generate_json_str(awesomeItems: list[AwesomeItem]) -> str:
     lists = []
 
     for key, _group in groupby(awesomeItems, lambda x: x.list.name):
-        group = list(_group)
-        l: AwesomeList = group[0].list
+        lists.append(output_list(list(_group)))
+    return serialize(Output(lists))
 
-        group.sort(key=lambda i: i.item.name)
 
-        items = [
-            OutputItem(
-                i.item.name, i.item.source, i.item.description, i.time.isoformat()
-            )
-            for i in group
-        ]
-        lists.append(OutputList(l.name, l.source, l.description, items))
-    return serialize(Output(lists))
+def output_list(group: list[AwesomeItem]) -> OutputList:
+    """The output of one crawled list, items sorted by name"""
+    l: AwesomeList = group[0].list
+
+    group = sorted(group, key=lambda i: i.item.name)
+
+    items = [
+        OutputItem(i.item.name, i.item.source, i.item.description, i.time.isoformat())
+        for i in group
+    ]
+    return OutputList(l.name, l.source, l.description, items)
+
+
+def crawled_lists(
+    results: Iterable[list[AwesomeItem]], held_back: set[str] = set()
+) -> Iterator[OutputList]:
+    """The output of each crawled list as soon as it arrives
+
+    Names in `held_back` are crawled more than once, their items are gathered
+    and yielded at the end.
+    """
+    held: dict[str, list[AwesomeItem]] = {}
+
+    for items in results:
+        if not items:
+            continue
+        name = items[0].list.name
+        if name in held_back:
+            held.setdefault(name, []).extend(items)
+            continue
+        yield output_list(items)
+
+    for items in held.values():
+        yield output_list(items)
+
 
+def stream_lists(
+    results: Iterable[list[AwesomeItem]],
+    old: Output,
+    held_back: set[str] = set(),
+    aliases: Optional[AliasIndex] = None,
+) -> Iterator[OutputList]:
+    """Merge each crawled list into the previous output as soon as it arrives
 
-def write_to_s3(content: str):
+    Lists are yielded in the order they are crawled, followed by the previous
+    lists that weren't crawled. A list found under a new name keeps the name
+    it was stored with, see `ListIndex`.
+    """
+    previous = ListIndex(old.lists, aliases)
+    for new_list in crawled_lists(results, held_back):
+        yield merge_list(previous.pop(new_list), new_list)
+    yield from previous.values()
+
+
+def journal_entry(
+    results: Iterable[list[AwesomeItem]],
+    old: Output,
+    held_back: set[str] = set(),
+    aliases: Optional[AliasIndex] = None,
+) -> Output:
+    """What the crawled lists add to the previous output, by stored name"""
+    previous = ListIndex(old.lists, aliases)
+    lists = []
+    for new_list in crawled_lists(results, held_back):
+        added = added_items(previous.get(new_list), new_list)
+        if added:
+            lists.append(added)
+    return Output(lists)
+
+
+def write_to_s3(
+    content: Union[str, BinaryIO], key: str = SNAPSHOT_KEY, codec: Optional[str] = None
+):
+    """Upload `content`, recording `codec` in its metadata when given"""
     logger.info("Starting S3 upload")
     try:
         logger.debug("Creating S3 client")
         client = boto3.client("s3")
         
-        content_size = len(content.encode('utf-8'))
-        logger.info(f"Uploading {content_size} bytes to S3 bucket 'awesome-crawler.allocsoc.net'")
+        if isinstance(content, str):
+            content_size = len(content.encode('utf-8'))
+        else:
+            content_size = content.seek(0, io.SEEK_END)
+            content.seek(0)
+        logger.info(f"Uploading {content_size} bytes to S3 bucket '{BUCKET}'")
         
-        client.put_object(
-            Body=content, Bucket="awesome-crawler.allocsoc.net", Key="data.json"
-        )
+        headers = content_headers(codec) if codec else {}
+        client.put_object(Body=content, Bucket=BUCKET, Key=key, **headers)
         
-        logger.info("Successfully uploaded data.json to S3")
+        logger.info(f"Successfully uploaded {key} to S3")
         
     except Exception as e:
         logger.error(f"Failed to upload to S3: {e}")
         raise
 
 
-def write_to_file(content: str, dest: Path):
-    with dest.open("w") as f:
-        f.write(content)
-
-
 def notify_backend_reload():
     """Notify the backend API to reload data from S3"""
     backend_url = "https://awesome.allocsoc.net/api/v1/reload"
@@ -78,27 +194,220 @@ def notify_backend_reload():
         logger.error(f"Unexpected error notifying backend reload: {e}")
 
 
-def generate_json(awesomeItems: list[AwesomeItem], dest: Path = None):
-    logger.info(f"Generating JSON from {len(awesomeItems)} awesome items")
+class MultipartUpload(io.RawIOBase):
+    """A file uploaded to S3 in parts as it is written
+
+    Up to `workers` parts are uploaded at once and writing waits while they
+    are all in flight, so at most `workers + 1` parts are held in memory.
+    Content smaller than one part is uploaded with a single put_object.
+    Leaving the `with` block with an exception aborts the upload.
+    """
+
+    def __init__(self, client, key: str, headers: dict, config: UploadConfig):
+        super().__init__()
+        self.client = client
+        self.key = key
+        self.headers = headers
+        self.config = config
+        self.buffer = bytearray()
+        self.size = 0
+        self.upload_id: Optional[str] = None
+        self.executor = ThreadPoolExecutor(config.workers)
+        self.in_flight: set[Future] = set()
+        self.parts: list[dict] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        self.size += len(data)
+        while len(self.buffer) >= self.config.part_size:
+            part = bytes(self.buffer[: self.config.part_size])
+            del self.buffer[: self.config.part_size]
+            self.upload_part(part)
+        return len(data)
+
+    def upload_part(self, part: bytes):
+        if self.upload_id is None:
+            response = self.client.create_multipart_upload(
+                Bucket=BUCKET, Key=self.key, **self.headers
+            )
+            self.upload_id = response["UploadId"]
+        if len(self.in_flight) >= self.config.workers:
+            self.wait(FIRST_COMPLETED)
+        number = len(self.parts) + len(self.in_flight) + 1
+        self.in_flight.add(self.executor.submit(self.send_part, number, part))
+
+    def send_part(self, number: int, part: bytes) -> dict:
+        response = self.client.upload_part(
+            Bucket=BUCKET,
+            Key=self.key,
+            PartNumber=number,
+            UploadId=self.upload_id,
+            Body=part,
+        )
+        return {"ETag": response["ETag"], "PartNumber": number}
+
+    def wait(self, return_when):
+        done, self.in_flight = wait(self.in_flight, return_when=return_when)
+        self.parts.extend(future.result() for future in done)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.upload_id is None:
+                self.client.put_object(
+                    Body=bytes(self.buffer), Bucket=BUCKET, Key=self.key, **self.headers
+                )
+            else:
+                if self.buffer:
+                    self.upload_part(bytes(self.buffer))
+                self.wait(ALL_COMPLETED)
+                self.client.complete_multipart_upload(
+                    Bucket=BUCKET,
+                    Key=self.key,
+                    UploadId=self.upload_id,
+                    MultipartUpload={
+                        "Parts": sorted(self.parts, key=lambda p: p["PartNumber"])
+                    },
+                )
+            logger.info(
+                f"Uploaded {self.size} bytes to {self.key} in {max(len(self.parts), 1)} parts"
+            )
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self.executor.shutdown()
+            super().close()
+
+    def abort(self):
+        for future in self.in_flight:
+            future.cancel()
+        self.executor.shutdown()
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(
+                Bucket=BUCKET, Key=self.key, UploadId=self.upload_id
+            )
+            self.upload_id = None
+        super().close()
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            logger.error(f"Aborting the upload of {self.key}: {exc}")
+            self.abort()
+
+
+def write_snapshot(
+    lists: Iterable[OutputList],
+    codec: str = CODEC_JSON,
+    upload: UploadConfig = UploadConfig(),
+):
+    """Upload the whole output, encoded and uploaded in parts as it is written"""
+    client = boto3.client("s3")
+    with MultipartUpload(client, SNAPSHOT_KEY, content_headers(codec), upload) as f:
+        # typeshed doesn't count raw binary files as IO[bytes]
+        encode_stream(lists, cast(IO[bytes], f), codec)
+
+
+def write_sharded_snapshot(lists: Iterable[OutputList]):
+    """Upload the output as one object per list, then the manifest listing them
+
+    Shards are stored under the hash of their content, so only the lists
+    that changed since the previous manifest are uploaded.
+    """
+    client = boto3.client("s3")
+    uploaded = {shard.hash for shard in read_manifest(client).shards}
+    shards = []
+    for output_list in lists:
+        data, digest = serialize_shard(output_list)
+        shard = Shard(output_list.name, f"{SHARD_PREFIX}{digest}.json.gz", digest)
+        if digest not in uploaded:
+            write_to_s3(io.BytesIO(data), shard.key)
+            uploaded.add(digest)
+        shards.append(shard)
+    print(f"📦 Wrote a manifest of {len(shards)} shards")
+    write_to_s3(serialize_manifest(Manifest(shards)), MANIFEST_KEY)
+
+
+def write_journal_entry(
+    entry: Output,
+    old: Output,
+    layout: str = LAYOUT_MONOLITHIC,
+    codec: str = CODEC_JSON,
+    upload: UploadConfig = UploadConfig(),
+):
+    """Append the entry of this run to the journal, compacting it when due
+
+    The entry is uploaded before the journal refers to it, and a compacted
+    snapshot before the journal drops its entries, so readers always find
+    everything; at worst they apply an entry twice, which changes nothing.
+    Compaction writes the snapshot in `layout`, which the journal records.
+    The entry and a monolithic snapshot are encoded with `codec`, the
+    snapshot is uploaded in parts as configured by `upload`.
+    """
+    client = boto3.client("s3")
+    run = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    key = f"{JOURNAL_PREFIX}{run}.json"
+    print(f"📜 Writing journal entry {key} with {len(entry.lists)} lists...")
+    write_to_s3(io.BytesIO(encode(entry, codec)), key, codec)
+
+    journal = read_journal(client)
+    journal.entries.append(key)
+    if len(journal.entries) >= COMPACT_EVERY:
+        print(f"🗜️  Compacting {len(journal.entries)} journal entries into the snapshot...")
+        lists = merge_outputs(old, entry).lists
+        if layout == LAYOUT_SHARDED:
+            write_sharded_snapshot(lists)
+        else:
+            write_snapshot(lists, codec, upload)
+        journal = Journal(run, [], layout)
+    write_to_s3(serialize_journal(journal), JOURNAL_KEY)
+
+
+def generate_json(
+    results: Iterable[list[AwesomeItem]],
+    dest: Path = None,
+    held_back: set[str] = set(),
+    layout: str = LAYOUT_MONOLITHIC,
+    codec: str = CODEC_JSON,
+    old: Optional[Output] = None,
+    upload: UploadConfig = UploadConfig(),
+    aliases: Optional[AliasIndex] = None,
+):
+    """Write what the crawled lists add to the previous output
+
+    On S3 only the new lists and items of this run are uploaded, as a
+    journal entry, see `write_journal_entry`; `layout` is how the snapshot
+    is written when the journal is compacted, `codec` how the entry and
+    snapshot are encoded and `upload` how the snapshot is uploaded. With
+    `dest` the whole output is written there, one list at a time as they are
+    crawled. The previous output is loaded unless `old` is given; `aliases`
+    matches lists that were renamed to the ones stored before.
+    """
+    logger.info("Generating JSON from the crawled lists")
     
     try:
-        content = generate_json_str(awesomeItems)
-        logger.debug(f"Generated initial JSON content: {len(content)} characters")
-
-        logger.info("Calculating delta with previous data")
-        added_new = delta(content)
-        content = serialize(added_new)
-        logger.info(f"Final content after delta: {len(content)} characters")
+        if old is None:
+            logger.info("Loading previous data for the delta")
+            old = load_current()
 
         if not dest:
             logger.info("Writing to S3 and notifying backend")
-            write_to_s3(content)
+            write_journal_entry(
+                journal_entry(results, old, held_back, aliases), old, layout, codec, upload
+            )
             # Notify backend to reload data after S3 upload
             notify_backend_reload()
             logger.info("S3 upload and backend notification complete")
         else:
             logger.info(f"Writing to local file: {dest}")
-            write_to_file(content, dest)
+            with dest.open("w") as f:
+                serialize_stream(stream_lists(results, old, held_back, aliases), f)
             logger.info("Local file write complete")
             
     except Exception as e:
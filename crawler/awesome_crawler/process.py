@@ -1,16 +1,44 @@
+import dataclasses
 import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack, contextmanager
 from dataclasses import dataclass
 from datetime import datetime
-from multiprocessing import Pool
-from typing import Optional
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Iterable, Iterator, Optional
 
 import tqdm
 
-from awesome_crawler.awesome_repo import process_awesome_repo
-from awesome_crawler.extractor import ExtractInfo
+from awesome_crawler.awesome_repo import (
+    CLONE_FULL,
+    fetch_awesome_repo,
+    parse_awesome_repo,
+    remote_head,
+)
+from awesome_crawler.extractor import ENGINE_AST, ExtractInfo
+from awesome_crawler.stats import ListStats, estimate_costs
 
 logger = logging.getLogger(__name__)
 
+FETCH_WORKERS = 16
+PARSE_WORKERS = 8
+LIST_TIMEOUT = 30 * 60
+PROBE_WORKERS = 32
+PROBE_TIMEOUT = 30
+
 
 @dataclass
 class AwesomeList:
@@ -30,24 +58,277 @@ class AwesomeItem:
 class CrawlerArgument:
     list: AwesomeList
     limit: Optional[int]
+    cache_dir: Optional[Path] = None
+    clone_mode: str = CLONE_FULL
+    incremental: bool = False
+    engine: str = ENGINE_AST
+    timeout: Optional[float] = None
+    # the commit the previous run extracted up to, for mirrors only
+    since: str = ""
+
+
+@dataclass
+class CrawlResult:
+    items: list[AwesomeItem]
+    stats: ListStats
+    list: AwesomeList
+
+
+class ListTimeout(Exception):
+    pass
+
+
+def raise_timeout(signum, frame):
+    raise ListTimeout()
+
+
+@contextmanager
+def time_limit(seconds: Optional[float]):
+    """Raise ListTimeout once `seconds` have passed, in the main thread only"""
+    if not seconds:
+        yield
+        return
+
+    previous = signal.signal(signal.SIGALRM, raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
 
 
-def crawl_repository(argument: CrawlerArgument):
+def crawled_now() -> str:
+    """When a list was crawled, in the format of the item times"""
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def fetch_repository(
+    argument: CrawlerArgument, dest: Path
+) -> tuple[Optional[Path], float]:
+    """The fetched repository path, None on failure, and the seconds it took"""
     awesomeList = argument.list
+    start = time.monotonic()
     try:
-        items = process_awesome_repo(
-            awesomeList.source.split("#")[0], limit=argument.limit
+        path = fetch_awesome_repo(
+            list_url(awesomeList),
+            dest,
+            cache_dir=argument.cache_dir,
+            clone_mode=argument.clone_mode,
+            limit=argument.limit,
+            timeout=argument.timeout,
         )
+        return path, time.monotonic() - start
+    except Exception:
+        logger.exception(f"failed to fetch repo {awesomeList}")
+        return None, time.monotonic() - start
+
+
+def parse_repository(
+    argument: CrawlerArgument, path: Path, spent: float = 0.0
+) -> CrawlResult:
+    """Parse a fetched repository within what is left of the list timeout"""
+    awesomeList = argument.list
+    start = time.monotonic()
+    remaining = argument.timeout and max(argument.timeout - spent, 1.0)
+    items: list[AwesomeItem] = []
+    commits = 0
+    timed_out = False
+    # a failed list is still processed up to where the previous run stopped
+    head = argument.since
+    try:
+        with time_limit(remaining):
+            parsed = parse_awesome_repo(
+                path,
+                limit=argument.limit,
+                since=argument.since or None,
+                incremental=argument.incremental,
+                engine=argument.engine,
+            )
         logger.error(f"succesful processed repo {awesomeList}")
-        return [AwesomeItem(item.item, awesomeList, item.time) for item in items]
+        commits = parsed.commits
+        items = [AwesomeItem(i.item, awesomeList, i.time) for i in parsed.items]
+        head = parsed.head
+    except ListTimeout:
+        logger.error(f"timed out after {argument.timeout}s processing {awesomeList}")
+        timed_out = True
     except Exception:
         logger.exception(f"failed to process repo {awesomeList}")
-        return []
 
+    duration = spent + time.monotonic() - start
+    stats = ListStats(
+        awesomeList.name, duration, commits, len(items), timed_out, crawled_now(), head
+    )
+    return CrawlResult(items, stats, awesomeList)
+
+
+def failed_fetch(argument: CrawlerArgument, spent: float) -> CrawlResult:
+    timed_out = bool(argument.timeout and spent >= argument.timeout)
+    if timed_out:
+        logger.error(f"timed out after {argument.timeout}s fetching {argument.list}")
+    stats = ListStats(
+        argument.list.name, spent, 0, 0, timed_out, crawled_now(), argument.since
+    )
+    return CrawlResult([], stats, argument.list)
+
+
+def failed_parse(argument: CrawlerArgument, spent: float) -> CrawlResult:
+    """The result of a list whose parse worker died, out of memory for instance"""
+    stats = ListStats(
+        argument.list.name, spent, 0, 0, False, crawled_now(), argument.since
+    )
+    return CrawlResult([], stats, argument.list)
+
+
+def list_url(awesomeList: AwesomeList) -> str:
+    return awesomeList.source.split("#")[0]
 
-def crawl_awesome(awesomeLists: list[AwesomeList], limit: Optional[int] = None):
-    arguments = [CrawlerArgument(list, limit) for list in awesomeLists]
-    with Pool(8) as p:
-        return list(
-            tqdm.tqdm(p.imap(crawl_repository, arguments), total=len(awesomeLists))
+
+def probe_head(awesomeList: AwesomeList) -> str:
+    """The remote HEAD of a list, empty when it can't be resolved"""
+    try:
+        return remote_head(list_url(awesomeList), PROBE_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"failed to resolve the HEAD of {awesomeList}: {e}")
+        return ""
+
+
+def probe_heads(
+    awesomeLists: list[AwesomeList], workers: int = PROBE_WORKERS
+) -> list[str]:
+    """The remote HEAD of every list, resolved with `git ls-remote` on threads"""
+    with ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(probe_head, awesomeLists))
+
+
+def unchanged_result(awesomeList: AwesomeList, previous: ListStats) -> CrawlResult:
+    """The result of a list still at the HEAD it was last crawled at"""
+    stats = dataclasses.replace(previous, crawled=crawled_now())
+    return CrawlResult([], stats, awesomeList)
+
+
+def crawl_awesome(
+    awesomeLists: list[AwesomeList],
+    limit: Optional[int] = None,
+    cache_dir: Optional[Path] = None,
+    clone_mode: str = CLONE_FULL,
+    incremental: bool = False,
+    engine: str = ENGINE_AST,
+    fetch_workers: int = FETCH_WORKERS,
+    parse_workers: Optional[int] = None,
+    stats: Optional[dict[str, ListStats]] = None,
+    timeout: Optional[float] = None,
+    probe: bool = False,
+) -> Iterator[CrawlResult]:
+    """Crawl the lists, fetching on threads and parsing on processes
+
+    Both stages run at the same time: a list is parsed as soon as it is
+    fetched, and results are yielded in the order they complete. `parse_workers`
+    defaults to the CPUs the crawler may use, at most PARSE_WORKERS. Only so many lists are fetched ahead of
+    the parsers, so temporary clones don't pile up on disk. A parse worker
+    that dies fails the lists it was parsing, and the others carry on in new
+    worker processes.
+
+    Lists start longest first according to the `stats` of the previous run,
+    and give up after `timeout` seconds, recording that they timed out.
+
+    With `probe`, the remote HEAD of every list is resolved first, and the
+    lists still at the HEAD the previous run crawled are not fetched at all;
+    their previous stats are yielded with an empty result.
+
+    Mirrors in `cache_dir` only walk the commits after the head recorded in
+    the previous `stats`, which are written once the output is, so a run that
+    fails before then is crawled again from the same commit.
+    """
+    stats = stats or {}
+    heads = probe_heads(awesomeLists) if probe else [""] * len(awesomeLists)
+    pending = []
+    for list, head in zip(awesomeLists, heads):
+        previous = stats.get(list.name)
+        if head and previous and previous.head == head:
+            yield unchanged_result(list, previous)
+        else:
+            pending.append((list, previous.head if cache_dir and previous else ""))
+    if probe:
+        logger.info(f"{len(awesomeLists) - len(pending)} lists unchanged since the last run")
+
+    costs = estimate_costs([list.name for list, _ in pending], stats, timeout)
+    arguments = [
+        CrawlerArgument(
+            list, limit, cache_dir, clone_mode, incremental, engine, timeout, since
         )
+        for list, since in sorted(pending, key=lambda p: costs[p[0].name], reverse=True)
+    ]
+    parse_workers = parse_workers or default_parse_workers()
+    ahead = fetch_workers + 2 * parse_workers
+    fetching: dict[Future, tuple[CrawlerArgument, Path]] = {}
+    parsing: dict[Future, tuple[CrawlerArgument, Path, float]] = {}
+
+    with ExitStack() as stack:
+        temp = stack.enter_context(TemporaryDirectory())
+        fetchers = stack.enter_context(ThreadPoolExecutor(fetch_workers))
+        parsers = stack.enter_context(parse_pool(parse_workers))
+        progress = stack.enter_context(tqdm.tqdm(total=len(arguments)))
+
+        queued = 0
+        while queued < len(arguments) or fetching or parsing:
+            while queued < len(arguments) and len(fetching) + len(parsing) < ahead:
+                dest = Path(temp) / str(queued)
+                fetch = fetchers.submit(fetch_repository, arguments[queued], dest)
+                fetching[fetch] = (arguments[queued], dest)
+                queued += 1
+
+            done, _ = wait([*fetching, *parsing], return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in fetching:
+                    argument, dest = fetching.pop(future)
+                    path, spent = future.result()
+                    if path is not None:
+                        try:
+                            parse = parsers.submit(parse_repository, argument, path, spent)
+                        except BrokenProcessPool:
+                            # a worker died, the lists it took down fail on their own
+                            logger.error("parse workers died, starting new ones")
+                            parsers = stack.enter_context(parse_pool(parse_workers))
+                            parse = parsers.submit(parse_repository, argument, path, spent)
+                        parsing[parse] = (argument, dest, spent)
+                        continue
+                    result = failed_fetch(argument, spent)
+                else:
+                    argument, dest, spent = parsing.pop(future)
+                    shutil.rmtree(dest, ignore_errors=True)
+                    try:
+                        result = future.result()
+                    except Exception:
+                        logger.exception(f"parse worker failed on {argument.list}")
+                        result = failed_parse(argument, spent)
+
+                progress.update()
+                yield result
+
+
+def default_parse_workers() -> int:
+    """The CPUs this process may run on, at most PARSE_WORKERS
+
+    os.cpu_count is every CPU of the host, far more than a pod is given.
+    """
+    cpu_count = getattr(os, "process_cpu_count", os.cpu_count)
+    return min(cpu_count() or 1, PARSE_WORKERS)
+
+
+def parse_pool(workers: int) -> ProcessPoolExecutor:
+    """Parse worker processes, started from a fork server
+
+    Forking the crawler itself would copy its fetch threads' locks into the
+    workers in whatever state they are in.
+    """
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("forkserver"))
+
+
+def collect_stats(
+    results: Iterable[CrawlResult], stats: list[ListStats]
+) -> Iterator[list[AwesomeItem]]:
+    """The items of each result, keeping their stats in `stats`"""
+    for result in results:
+        stats.append(result.stats)
+        yield result.items
@@ -1,13 +1,29 @@
-import random
+import hashlib
 import logging
+from bisect import bisect_left
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import List
+from statistics import median
+from typing import List, Optional
 
 from awesome_crawler.process import AwesomeList
 from awesome_crawler.serialize import Output, OutputList
+from awesome_crawler.stats import ListStats, estimate_costs
 
 logger = logging.getLogger(__name__)
 
+# activity buckets: lists last updated within each number of days
+BUCKET_DAYS = [30, 365, 730]
+BUCKET_NAMES = ["last_month", "last_year", "last_2_years", "older_than_2_years"]
+# every list is crawled at least this often, budget permitting
+MAX_STALENESS_DAYS = 14
+# each list is due up to this fraction of MAX_STALENESS_DAYS early, by its name
+STALENESS_SPREAD = 0.25
+# item additions are counted over this window to estimate how often a list changes
+HISTORY_DAYS = 365
+# without a budget, lists are crawled once this many new items are expected
+MIN_EXPECTED_CHANGES = 1.0
+
 
 def get_last_update_time(repo_data: OutputList) -> datetime:
     """Get the most recent update time from a repository's items"""
@@ -26,104 +42,190 @@ def get_last_update_time(repo_data: OutputList) -> datetime:
     return latest_time
 
 
-def calculate_sampling_probability(last_update: datetime) -> float:
-    """Calculate sampling probability based on last update time
-    
-    Rules:
-    - Last month: 90% probability
-    - Last 1 year: 50% probability  
-    - Last 2 years: 20% probability
-    - More than 3 years: 5% probability
+def last_update_index(s3_data: Optional[Output]) -> dict[str, datetime]:
+    """The last update time of every list by name, the first list wins
+
+    Item times are ISO strings in the same format, so the latest one is the
+    greatest string and only that one is parsed; lists where it doesn't
+    parse fall back to `get_last_update_time`.
     """
+    index: dict[str, datetime] = {}
+    for repo_data in s3_data.lists if s3_data else []:
+        if repo_data.name in index:
+            continue
+        latest = max((item.time for item in repo_data.items), default=None)
+        try:
+            index[repo_data.name] = datetime.fromisoformat(latest) if latest else datetime.min
+        except ValueError:
+            index[repo_data.name] = get_last_update_time(repo_data)
+    return index
+
+
+def activity_bucket(last_update: datetime, now: datetime) -> int:
+    """The index of the activity bucket of a list, 0 being the most active"""
+    return bisect_left(BUCKET_DAYS, (now - last_update) / timedelta(days=1))
+
+
+def classify(repos: List[AwesomeList], last_updates: dict[str, datetime]) -> list[Optional[int]]:
+    """The activity bucket of each repository, None when it has no data"""
     now = datetime.now()
-    time_diff = now - last_update
-    
-    if time_diff <= timedelta(days=30):  # Last month
-        return 0.9
-    elif time_diff <= timedelta(days=365):  # Last year
-        return 0.5
-    elif time_diff <= timedelta(days=730):  # Last 2 years
-        return 0.2
-    elif time_diff <= timedelta(days=1095):  # Last 3 years
-        return 0.05
-    else:  # More than 3 years
-        return 0.05
-
-
-def filter_repositories_by_activity(repos: List[AwesomeList], s3_data: Output) -> List[AwesomeList]:
-    """Filter repositories based on their last update activity using probabilistic sampling"""
-    if not s3_data or not s3_data.lists:
-        logger.info("No S3 data available, processing all repositories")
-        return repos
-    
-    # Create lookup for S3 data by repository name
-    s3_lookup = {repo_data.name: repo_data for repo_data in s3_data.lists}
-    
-    filtered_repos = []
-    total_repos = len(repos)
-    
-    for repo in repos:
-        repo_data = s3_lookup.get(repo.name)
-        
-        if not repo_data:
-            # New repository not in S3 data - always include
-            filtered_repos.append(repo)
-            logger.debug(f"Including new repository: {repo.name}")
+    return [
+        activity_bucket(last_updates[repo.name], now) if repo.name in last_updates else None
+        for repo in repos
+    ]
+
+
+def change_rates(
+    s3_data: Optional[Output], now: datetime, history_days: int = HISTORY_DAYS
+) -> dict[str, float]:
+    """Items added per day to every list by name, over the last `history_days`
+
+    Item times are ISO strings, so the recent ones are found by comparing
+    them with the start of the window as strings. Half an item is added to
+    every window so that quiet lists still get crawled now and then.
+    """
+    start = (now - timedelta(days=history_days)).isoformat(timespec="seconds")
+    rates: dict[str, float] = {}
+    for repo_data in s3_data.lists if s3_data else []:
+        if repo_data.name in rates:
             continue
-        
-        last_update = get_last_update_time(repo_data)
-        probability = calculate_sampling_probability(last_update)
-        
-        # Random sampling based on probability
-        if random.random() < probability:
-            filtered_repos.append(repo)
-            logger.debug(f"Including repository: {repo.name} (last update: {last_update.strftime('%Y-%m-%d')}, probability: {probability:.0%})")
+        added = sum(1 for item in repo_data.items if item.time >= start)
+        rates[repo_data.name] = (added + 0.5) / history_days
+    return rates
+
+
+@dataclass
+class ListSchedule:
+    """What the scheduler knows about a list, `None` for a new one"""
+
+    repo: AwesomeList
+    staleness: Optional[float]
+    expected_changes: float
+    cost: float
+
+    def overdue(self, max_staleness: float) -> bool:
+        return self.staleness is None or self.staleness >= staleness_deadline(
+            self.repo.name, max_staleness
+        )
+
+
+def staleness_deadline(name: str, max_staleness: float) -> float:
+    """The days after which a list is overdue, at most `max_staleness`
+
+    Lists crawled on the same day would all be due on the same day again,
+    every `max_staleness` days. Each list is due a little early instead, by
+    a fraction of `STALENESS_SPREAD` that a hash of its name sets, so their
+    crawls spread out over the following runs.
+    """
+    digest = hashlib.sha256(name.encode()).digest()
+    fraction = int.from_bytes(digest[:8], "big") / 2**64
+    return max_staleness * (1 - STALENESS_SPREAD * fraction)
+
+
+def list_schedules(
+    repos: List[AwesomeList],
+    s3_data: Optional[Output],
+    stats: dict[str, ListStats],
+    now: datetime,
+) -> list[ListSchedule]:
+    """The staleness, expected new items and crawl cost of every repository
+
+    A list is as stale as the days since it was last crawled, or since its
+    last item when no run recorded a crawl yet. New lists are expected to
+    take the median duration of the others: as slow as the slowest, as
+    `estimate_costs` has it, they would never fit in a time budget.
+    """
+    last_updates = last_update_index(s3_data)
+    rates = change_rates(s3_data, now)
+    costs = estimate_costs([repo.name for repo in repos], stats)
+    durations = [s.duration for s in stats.values() if s.duration > 0]
+    typical = median(durations) if durations else 0.0
+    schedules = []
+    for repo in repos:
+        previous = stats.get(repo.name)
+        if previous and previous.crawled:
+            last_visit: Optional[datetime] = datetime.fromisoformat(previous.crawled)
         else:
-            logger.debug(f"Skipping repository: {repo.name} (last update: {last_update.strftime('%Y-%m-%d')}, probability: {probability:.0%})")
-    
-    filtered_count = len(filtered_repos)
-    logger.info(f"Probabilistic sampling: {filtered_count}/{total_repos} repositories selected ({filtered_count/total_repos:.1%})")
-    
-    return filtered_repos
+            last_visit = last_updates.get(repo.name)
+        staleness = None if last_visit is None else (now - last_visit) / timedelta(days=1)
+        expected = rates.get(repo.name, 0.0) * (staleness or 0.0)
+        cost = costs[repo.name] if previous else typical
+        schedules.append(ListSchedule(repo, staleness, expected, cost))
+    return schedules
+
+
+def schedule_repositories(
+    repos: List[AwesomeList],
+    s3_data: Optional[Output],
+    stats: dict[str, ListStats],
+    budget_lists: Optional[int] = None,
+    budget_seconds: Optional[float] = None,
+    max_staleness: float = MAX_STALENESS_DAYS,
+) -> List[AwesomeList]:
+    """The repositories worth crawling in this run, in their original order
+
+    New lists and lists not crawled for `max_staleness` days come first,
+    the most stale first; see `staleness_deadline` for when a list is due. The others follow by the new items expected since
+    their last crawl, per second of crawling when there is a time budget.
+    Without a budget only those expected to have `MIN_EXPECTED_CHANGES`
+    are added. Lists are taken while they fit in `budget_lists` and in
+    `budget_seconds` of estimated crawl time, see `estimate_costs`.
+    """
+    now = datetime.now()
+    schedules = list_schedules(repos, s3_data, stats, now)
+
+    def staleness(schedule: ListSchedule) -> float:
+        return float("inf") if schedule.staleness is None else schedule.staleness
+
+    def priority(schedule: ListSchedule) -> float:
+        if budget_seconds is None:
+            return schedule.expected_changes
+        return schedule.expected_changes / max(schedule.cost, 1.0)
+
+    overdue = sorted(
+        (s for s in schedules if s.overdue(max_staleness)), key=staleness, reverse=True
+    )
+    others = sorted(
+        (s for s in schedules if not s.overdue(max_staleness)),
+        key=priority,
+        reverse=True,
+    )
+    if budget_lists is None and budget_seconds is None:
+        others = [s for s in others if s.expected_changes >= MIN_EXPECTED_CHANGES]
+
+    selected: set[int] = set()
+    spent = 0.0
+    for schedule in overdue + others:
+        if budget_lists is not None and len(selected) >= budget_lists:
+            break
+        if budget_seconds is not None and spent + schedule.cost > budget_seconds:
+            continue
+        selected.add(id(schedule.repo))
+        spent += schedule.cost
+
+    left_overdue = sum(1 for s in overdue if id(s.repo) not in selected)
+    if left_overdue:
+        logger.warning(f"{left_overdue} overdue repositories don't fit in the budget")
+    logger.info(
+        f"Scheduled {len(selected)}/{len(repos)} repositories, {len(overdue)} overdue, "
+        f"{spent:.0f}s of estimated crawl time"
+    )
+    return [repo for repo in repos if id(repo) in selected]
 
 
-def log_sampling_statistics(repos: List[AwesomeList], s3_data: Output):
+def log_sampling_statistics(repos: List[AwesomeList], last_updates: dict[str, datetime]):
     """Log statistics about repository update times for analysis"""
-    if not s3_data or not s3_data.lists:
+    if not last_updates:
         return
     
-    s3_lookup = {repo_data.name: repo_data for repo_data in s3_data.lists}
-    stats = {
-        "last_month": 0,
-        "last_year": 0, 
-        "last_2_years": 0,
-        "older_than_3_years": 0,
-        "no_data": 0
-    }
-    
-    for repo in repos:
-        repo_data = s3_lookup.get(repo.name)
-        if not repo_data:
-            stats["no_data"] += 1
-            continue
-            
-        last_update = get_last_update_time(repo_data)
-        now = datetime.now()
-        time_diff = now - last_update
-        
-        if time_diff <= timedelta(days=30):
-            stats["last_month"] += 1
-        elif time_diff <= timedelta(days=365):
-            stats["last_year"] += 1
-        elif time_diff <= timedelta(days=730):
-            stats["last_2_years"] += 1
-        else:
-            stats["older_than_3_years"] += 1
+    stats = dict.fromkeys(BUCKET_NAMES + ["no_data"], 0)
+    for bucket in classify(repos, last_updates):
+        stats["no_data" if bucket is None else BUCKET_NAMES[bucket]] += 1
     
     total = len(repos)
     logger.info(f"Repository activity distribution:")
-    logger.info(f"  Last month: {stats['last_month']}/{total} ({stats['last_month']/total:.1%}) - 90% sampling rate")
-    logger.info(f"  Last year: {stats['last_year']}/{total} ({stats['last_year']/total:.1%}) - 50% sampling rate") 
-    logger.info(f"  Last 2 years: {stats['last_2_years']}/{total} ({stats['last_2_years']/total:.1%}) - 20% sampling rate")
-    logger.info(f"  Older than 3 years: {stats['older_than_3_years']}/{total} ({stats['older_than_3_years']/total:.1%}) - 5% sampling rate")
-    logger.info(f"  No data: {stats['no_data']}/{total} ({stats['no_data']/total:.1%}) - 100% sampling rate")
\ No newline at end of file
+    logger.info(f"  Last month: {stats['last_month']}/{total} ({stats['last_month']/total:.1%})")
+    logger.info(f"  Last year: {stats['last_year']}/{total} ({stats['last_year']/total:.1%})") 
+    logger.info(f"  Last 2 years: {stats['last_2_years']}/{total} ({stats['last_2_years']/total:.1%})")
+    logger.info(f"  Older than 2 years: {stats['older_than_2_years']}/{total} ({stats['older_than_2_years']/total:.1%})")
+    logger.info(f"  No data: {stats['no_data']}/{total} ({stats['no_data']/total:.1%})")
\ No newline at end of file
@@ -1,8 +1,47 @@
 import dataclasses
+import gzip
+import hashlib
+import io
 import json
+from typing import IO, TYPE_CHECKING, Iterable, Optional, TextIO, Union
 
 from cattr import structure, unstructure
 
+# optional, split_codec checks the codecs that need them are installed
+if TYPE_CHECKING:
+    import msgpack
+    import zstandard
+else:
+    try:
+        import zstandard
+    except ImportError:
+        zstandard = None
+
+    try:
+        import msgpack
+    except ImportError:
+        msgpack = None
+
+LAYOUT_MONOLITHIC = "monolithic"
+LAYOUT_SHARDED = "sharded"
+LAYOUTS = (LAYOUT_MONOLITHIC, LAYOUT_SHARDED)
+
+FORMAT_JSON = "json"
+FORMAT_MSGPACK = "msgpack"
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_ZSTD = "zstd"
+
+CODEC_JSON = FORMAT_JSON
+CODECS = (
+    CODEC_JSON,
+    f"{FORMAT_JSON}+{COMPRESSION_GZIP}",
+    f"{FORMAT_JSON}+{COMPRESSION_ZSTD}",
+    FORMAT_MSGPACK,
+    f"{FORMAT_MSGPACK}+{COMPRESSION_ZSTD}",
+)
+
+CONTENT_TYPES = {FORMAT_JSON: "application/json", FORMAT_MSGPACK: "application/msgpack"}
+
 
 @dataclasses.dataclass
 class OutputItem:
@@ -25,9 +64,188 @@ class Output:
     lists: list[OutputList]
 
 
+@dataclasses.dataclass
+class Journal:
+    """The runs applied on top of the snapshot, oldest first
+
+    `snapshot` is the run the snapshot was compacted at, and `entries` the
+    keys of the per-run deltas written since.
+    """
+
+    snapshot: str
+    entries: list[str]
+    layout: str = LAYOUT_MONOLITHIC
+
+
+@dataclasses.dataclass
+class Shard:
+    """One list of a sharded snapshot, stored under the hash of its JSON"""
+
+    name: str
+    key: str
+    hash: str
+
+
+@dataclasses.dataclass
+class Manifest:
+    shards: list[Shard]
+
+
+def list_to_dict(output_list: OutputList) -> dict:
+    """What `unstructure` returns for a list, without its per-field dispatch"""
+    return {
+        "name": output_list.name,
+        "source": output_list.source,
+        "description": output_list.description,
+        "items": [
+            {
+                "name": item.name,
+                "source": item.source,
+                "description": item.description,
+                "time": item.time,
+            }
+            for item in output_list.items
+        ],
+    }
+
+
+def list_from_dict(data: dict) -> OutputList:
+    """What `structure` returns for a list, without its per-field dispatch"""
+    return OutputList(
+        data["name"],
+        data["source"],
+        data["description"],
+        [
+            OutputItem(item["name"], item["source"], item["description"], item["time"])
+            for item in data["items"]
+        ],
+    )
+
+
+def output_to_dict(output: Output) -> dict:
+    return {"lists": [list_to_dict(output_list) for output_list in output.lists]}
+
+
+def output_from_dict(data: dict) -> Output:
+    return Output([list_from_dict(output_list) for output_list in data["lists"]])
+
+
 def serialize(output: Output) -> str:
-    return json.dumps(unstructure(output))
+    return json.dumps(output_to_dict(output))
+
+
+def deserialize(data: Union[str, bytes]) -> Output:
+    return output_from_dict(json.loads(data))
+
+
+def serialize_journal(journal: Journal) -> str:
+    return json.dumps(unstructure(journal))
+
+
+def deserialize_journal(data: str) -> Journal:
+    return structure(json.loads(data), Journal)
+
+
+def serialize_shard(output_list: OutputList) -> tuple[bytes, str]:
+    """The gzipped JSON of a list, and the sha256 of that JSON"""
+    data = json.dumps(list_to_dict(output_list)).encode("utf-8")
+    return gzip.compress(data, mtime=0), hashlib.sha256(data).hexdigest()
+
+
+def deserialize_shard(data: bytes) -> OutputList:
+    return list_from_dict(json.loads(gzip.decompress(data)))
+
+
+def serialize_manifest(manifest: Manifest) -> str:
+    return json.dumps(unstructure(manifest))
+
+
+def deserialize_manifest(data: str) -> Manifest:
+    return structure(json.loads(data), Manifest)
+
+
+def serialize_stream(lists: Iterable[OutputList], out: TextIO):
+    """Write what `serialize` returns for `Output(lists)`, one list at a time"""
+    out.write('{"lists": [')
+    for index, output_list in enumerate(lists):
+        if index:
+            out.write(", ")
+        out.write(json.dumps(list_to_dict(output_list)))
+    out.write("]}")
+
+
+def split_codec(codec: str) -> tuple[str, Optional[str]]:
+    """The format and the compression, if any, of a codec like `json+zstd`"""
+    format, _, compression = codec.partition("+")
+    if format not in CONTENT_TYPES or compression not in ("", COMPRESSION_GZIP, COMPRESSION_ZSTD):
+        raise ValueError(f"unknown codec {codec}")
+    if COMPRESSION_ZSTD in (format, compression) and zstandard is None:
+        raise ValueError(f"the {codec} codec needs the zstandard package")
+    if format == FORMAT_MSGPACK and msgpack is None:
+        raise ValueError(f"the {codec} codec needs the msgpack package")
+    return format, compression or None
+
+
+def content_headers(codec: str) -> dict[str, str]:
+    """The S3 metadata an object encoded with `codec` is stored with"""
+    format, compression = split_codec(codec)
+    headers = {"ContentType": CONTENT_TYPES[format]}
+    if compression:
+        headers["ContentEncoding"] = compression
+    return headers
+
+
+def codec_of(obj: dict) -> str:
+    """The codec of an S3 object, from its Content-Type and Content-Encoding
+
+    Objects written before codecs existed have neither, and are JSON.
+    """
+    format = FORMAT_MSGPACK if obj.get("ContentType") == CONTENT_TYPES[FORMAT_MSGPACK] else FORMAT_JSON
+    compression = obj.get("ContentEncoding")
+    return f"{format}+{compression}" if compression else format
+
+
+def encode(output: Output, codec: str = CODEC_JSON) -> bytes:
+    out = io.BytesIO()
+    encode_stream(output.lists, out, codec)
+    return out.getvalue()
+
+
+def decode(data: bytes, codec: str = CODEC_JSON) -> Output:
+    format, compression = split_codec(codec)
+    if compression == COMPRESSION_GZIP:
+        data = gzip.decompress(data)
+    elif compression == COMPRESSION_ZSTD:
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if format == FORMAT_MSGPACK:
+        return output_from_dict(msgpack.unpackb(data))
+    return deserialize(data)
+
+
+def encode_stream(lists: Iterable[OutputList], out: IO[bytes], codec: str = CODEC_JSON):
+    """Write `Output(lists)` encoded with `codec`, one list at a time"""
+    format, compression = split_codec(codec)
+    compressed: Union[gzip.GzipFile, zstandard.ZstdCompressionWriter, None]
+    if compression == COMPRESSION_GZIP:
+        compressed = gzip.GzipFile(fileobj=out, mode="wb", mtime=0)
+    elif compression == COMPRESSION_ZSTD:
+        compressed = zstandard.ZstdCompressor().stream_writer(out, closefd=False)
+    else:
+        compressed = None
 
+    target = compressed or out
+    if format == FORMAT_MSGPACK:
+        lists = list(lists)
+        packer = msgpack.Packer()
+        target.write(packer.pack_map_header(1) + packer.pack("lists"))
+        target.write(packer.pack_array_header(len(lists)))
+        for output_list in lists:
+            target.write(packer.pack(list_to_dict(output_list)))
+    else:
+        text = io.TextIOWrapper(target, encoding="utf-8")
+        serialize_stream(lists, text)
+        text.flush()
+        text.detach()
 
-def deserialize(data: str) -> Output:
-    return structure(json.loads(data), Output)
+    if compressed:
+        compressed.close()
@@ -0,0 +1,146 @@
+import dataclasses
+import json
+import logging
+from pathlib import Path
+from typing import Optional
+
+import boto3
+from cattr import structure, unstructure
+
+from awesome_crawler.delta import BUCKET
+from awesome_crawler.urls import AliasIndex
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "stats.json"
+ALIASES_KEY = "aliases.json"
+
+
+@dataclasses.dataclass
+class ListStats:
+    """How long crawling a list took and when, to schedule the next runs"""
+
+    name: str
+    duration: float
+    commits: int
+    items: int
+    timed_out: bool = False
+    crawled: str = ""
+    # the remote HEAD the list was crawled at, empty when the crawl failed
+    head: str = ""
+
+
+def serialize_stats(stats: list[ListStats]) -> str:
+    return json.dumps(unstructure(stats))
+
+
+def deserialize_stats(data: str) -> dict[str, ListStats]:
+    return {s.name: s for s in structure(json.loads(data), list[ListStats])}
+
+
+def stats_path(dest: Path) -> Path:
+    """The stats are kept next to the output file"""
+    return dest.with_name(STATS_KEY)
+
+
+def read_stats(dest: Optional[Path] = None) -> dict[str, ListStats]:
+    """The stats of the previous run by list name, from S3 without `dest`"""
+    try:
+        if dest:
+            data = stats_path(dest).read_text()
+        else:
+            client = boto3.client("s3")
+            data = client.get_object(Bucket=BUCKET, Key=STATS_KEY)["Body"].read()
+        return deserialize_stats(data)
+    except Exception as e:
+        logger.warning(f"no stats from a previous run: {e}")
+        return {}
+
+
+def write_stats(stats: list[ListStats], dest: Optional[Path] = None):
+    content = serialize_stats(stats)
+    if dest:
+        stats_path(dest).write_text(content)
+    else:
+        client = boto3.client("s3")
+        client.put_object(Body=content, Bucket=BUCKET, Key=STATS_KEY)
+    logger.info(f"wrote stats of {len(stats)} lists")
+
+
+def serialize_aliases(index: AliasIndex) -> str:
+    return json.dumps(unstructure(index))
+
+
+def deserialize_aliases(data: str) -> AliasIndex:
+    return structure(json.loads(data), AliasIndex)
+
+
+def aliases_path(dest: Path) -> Path:
+    """The aliases are kept next to the output file, like the stats"""
+    return dest.with_name(ALIASES_KEY)
+
+
+def read_aliases(dest: Optional[Path] = None) -> AliasIndex:
+    """The alias index of the previous runs, from S3 without `dest`"""
+    try:
+        if dest:
+            data = aliases_path(dest).read_text()
+        else:
+            client = boto3.client("s3")
+            data = client.get_object(Bucket=BUCKET, Key=ALIASES_KEY)["Body"].read()
+        return deserialize_aliases(data)
+    except Exception as e:
+        logger.warning(f"no aliases from a previous run: {e}")
+        return AliasIndex()
+
+
+def write_aliases(index: AliasIndex, dest: Optional[Path] = None):
+    content = serialize_aliases(index)
+    if dest:
+        aliases_path(dest).write_text(content)
+    else:
+        client = boto3.client("s3")
+        client.put_object(Body=content, Bucket=BUCKET, Key=ALIASES_KEY)
+    logger.info(f"wrote {len(index.aliases)} aliases")
+
+
+def estimate_costs(
+    names: list[str], stats: dict[str, ListStats], timeout: Optional[float] = None
+) -> dict[str, float]:
+    """Expected crawl duration of each list, from the previous run
+
+    Lists take as long as they did. Lists without a recorded duration are
+    estimated from their commits and items, at the seconds per commit and
+    item of the others. Lists that timed out took at least their recorded
+    duration, so they are expected to take the `timeout`, or as long as the
+    slowest list without one. Lists never crawled before are expected to be
+    as slow as the slowest known one, as starting them late is what makes a
+    long tail.
+    """
+    known = [stats[name] for name in names if name in stats]
+    slowest = max((s.duration for s in known), default=0.0)
+    measured = [s for s in known if s.duration > 0]
+    work = sum(s.commits + s.items for s in measured)
+    per_unit = sum(s.duration for s in measured) / work if work else 0.0
+
+    costs = {}
+    for name in names:
+        previous = stats.get(name)
+        if previous is None:
+            costs[name] = slowest
+        elif previous.timed_out:
+            costs[name] = max(previous.duration, slowest, timeout or 0.0)
+        elif previous.duration > 0:
+            costs[name] = previous.duration
+        else:
+            costs[name] = (previous.commits + previous.items) * per_unit
+    return costs
+
+
+def merge_stats(
+    previous: dict[str, ListStats], current: list[ListStats]
+) -> list[ListStats]:
+    """Lists not crawled this run keep their previous stats"""
+    merged = dict(previous)
+    merged.update((stats.name, stats) for stats in current)
+    return list(merged.values())
@@ -0,0 +1,76 @@
+import dataclasses
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+GITHUB_HOST = "github.com"
+REDIRECT_WORKERS = 16
+REDIRECT_TIMEOUT = 10
+
+
+def canonical_url(url: str) -> Optional[str]:
+    """The URL of a repository without the differences that don't change it
+
+    The scheme becomes https, the host is lowercased without `www.`, and the
+    query, fragment, trailing slashes and `.git` suffix are dropped. GitHub
+    paths are case insensitive, so they are lowercased and cut to
+    `owner/repo`. Anything but an http(s) URL has no canonical URL.
+    """
+    parts = urlsplit(url.strip())
+    if parts.scheme.lower() not in ("http", "https") or not parts.netloc:
+        return None
+    host = parts.netloc.lower().removeprefix("www.")
+    path = parts.path.rstrip("/").removesuffix(".git").rstrip("/")
+    if host == GITHUB_HOST:
+        path = "/".join(path.lower().split("/")[:3])
+    return f"https://{host}{path}"
+
+
+@dataclasses.dataclass
+class AliasIndex:
+    """Canonical URLs of renamed repositories, to the URL they redirect to"""
+
+    aliases: dict[str, str] = dataclasses.field(default_factory=dict)
+
+    def resolve(self, url: str) -> Optional[str]:
+        """The canonical URL of the repository at `url`, following renames"""
+        current = canonical_url(url)
+        seen = set()
+        while current in self.aliases and current not in seen:
+            seen.add(current)
+            current = self.aliases[current]
+        return current
+
+    def add(self, alias: str, target: str):
+        alias_url, target_url = canonical_url(alias), canonical_url(target)
+        if alias_url and target_url and alias_url != target_url:
+            self.aliases[alias_url] = target_url
+
+
+def redirect_target(url: str) -> Optional[str]:
+    """Where GitHub redirects a repository URL to, None when it can't tell"""
+    try:
+        response = requests.head(url, allow_redirects=True, timeout=REDIRECT_TIMEOUT)
+    except requests.RequestException as e:
+        logger.warning(f"failed to resolve redirects of {url}: {e}")
+        return None
+    return response.url if response.ok else None
+
+
+def resolve_redirects(
+    urls: Iterable[str], index: AliasIndex, workers: int = REDIRECT_WORKERS
+):
+    """Add the GitHub repositories that were renamed to the index"""
+    canonical = {index.resolve(url) for url in urls}
+    github = sorted(
+        url for url in canonical if url and urlsplit(url).netloc == GITHUB_HOST
+    )
+    with ThreadPoolExecutor(workers) as executor:
+        for url, target in zip(github, executor.map(redirect_target, github)):
+            if target:
+                index.add(url, target)
@@ -0,0 +1,46 @@
+"""Size, decode time and peak memory of each codec
+
+    python -m benchmarks.codecs [--lists 2000] [--items 300]
+
+The output is shaped like the snapshot: every list has items with urls,
+short descriptions and ISO timestamps.
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from awesome_crawler.serialize import CODECS, decode, encode
+from benchmarks.delta_merge import synthetic_outputs
+
+
+def bench(codec: str, output) -> tuple[int, float, int]:
+    data = encode(output, codec)
+    tracemalloc.start()
+    start = time.perf_counter()
+    decoded = decode(data, codec)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert decoded == output
+    return len(data), elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lists", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=300)
+    args = parser.parse_args()
+
+    output, _ = synthetic_outputs(args.lists, args.items)
+    print(f"{args.lists} lists x {args.items} items")
+    for codec in CODECS:
+        size, elapsed, peak = bench(codec, output)
+        print(
+            f"{codec:>13}: {size / 2**20:7.1f}MB {elapsed:6.2f}s "
+            f"peak {peak / 2**20:7.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
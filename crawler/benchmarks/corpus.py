@@ -0,0 +1,60 @@
+"""README corpus shared by the extraction benchmarks
+
+Real awesome-list READMEs can be passed as paths (files or directories of
+`*.md` files); without them a synthetic corpus following the usual
+`- [Name](url) - description` conventions is generated.
+"""
+import random
+from pathlib import Path
+from typing import Iterable
+
+# most descriptions are plain text, some use inline markdown
+DESCRIPTIONS = [
+    "A library for parsing things.",
+    "Fast and `simple` HTTP client.",
+    "**Recommended** - web framework with batteries included.",
+    "Tool to *manage* configuration files, see [docs](https://docs.example.com).",
+    "Test runner.",
+]
+WEIGHTS = [8, 1, 1, 1, 8]
+
+
+def synthetic_readme(sections: int, items: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    lines = [
+        "# Awesome Synthetic [![Awesome](https://awesome.re/badge.svg)](https://awesome.re)",
+        "",
+        "> A curated list of generated things.",
+        "",
+        "## Contents",
+        "",
+    ]
+    lines += [f"- [Section {s}](#section-{s})" for s in range(sections)]
+
+    for s in range(sections):
+        lines += ["", f"## Section {s}", ""]
+        for i in range(items):
+            name = f"project-{s}-{i}"
+            url = f"https://github.com/owner{s}/{name}"
+            description = rng.choices(DESCRIPTIONS, WEIGHTS)[0]
+            lines.append(f"- [{name}]({url}) - {description}")
+            if i % 25 == 0:
+                lines.append(f"  - [{name}-plugin]({url}-plugin) - Plugin for {name}.")
+        lines += ["", "```sh", "pip install something", "```"]
+
+    return "\n".join(lines) + "\n"
+
+
+def load_corpus(paths: Iterable[str]) -> list[str]:
+    files: list[Path] = []
+    for path in map(Path, paths):
+        files += sorted(path.glob("**/*.md")) if path.is_dir() else [path]
+
+    if files:
+        return [f.read_text(encoding="utf-8") for f in files]
+
+    sizes = [(1, 10), (5, 20), (20, 40), (60, 50), (2, 3000)]
+    return [
+        synthetic_readme(sections, items, seed)
+        for seed, (sections, items) in enumerate(sizes)
+    ]
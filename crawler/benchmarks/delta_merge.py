@@ -0,0 +1,73 @@
+"""Name indexed delta vs the previous linear scans
+
+    python -m benchmarks.delta_merge [--lists 5000] [--items 500]
+
+Every list of the previous output is crawled again with a few new items,
+and some new lists show up, as in a daily run.
+"""
+
+import argparse
+import random
+import time
+from unittest import mock
+
+from awesome_crawler.delta import merge_outputs
+from awesome_crawler.serialize import Output, OutputItem, OutputList
+from benchmarks import legacy_delta
+
+
+def synthetic_outputs(lists: int, items: int, seed: int = 0) -> tuple[Output, Output]:
+    rng = random.Random(seed)
+
+    def output_list(name: str, item_names) -> OutputList:
+        return OutputList(
+            name,
+            f"https://github.com/{name}",
+            "",
+            [OutputItem(i, f"https://{i}.com", "", "2020-09-26") for i in item_names],
+        )
+
+    old = [
+        output_list(f"list-{n}", [f"item-{n}-{i}" for i in range(items)])
+        for n in range(lists)
+    ]
+    new = [
+        output_list(
+            f"list-{n}",
+            [f"item-{n}-{i}" for i in range(rng.randrange(items // 2), items + 5)],
+        )
+        for n in range(lists + lists // 20)
+    ]
+    rng.shuffle(new)
+    return Output(old), Output(new)
+
+
+def legacy_merge(old: Output, new: Output) -> Output:
+    with mock.patch.object(legacy_delta, "deserialize", side_effect=lambda x: x):
+        return legacy_delta.delta(new, old)
+
+
+def bench(name: str, merge, lists: int, items: int) -> tuple[float, Output]:
+    old, new = synthetic_outputs(lists, items)
+    start = time.perf_counter()
+    merged = merge(old, new)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>8}: {elapsed:8.2f}s")
+    return elapsed, merged
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lists", type=int, default=5000)
+    parser.add_argument("--items", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{args.lists} lists x {args.items} items")
+    after, merged = bench("indexed", merge_outputs, args.lists, args.items)
+    before, legacy = bench("legacy", legacy_merge, args.lists, args.items)
+    print(f"identical: {merged == legacy}")
+    print(f"speedup: {before / after:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Hand-written converters vs cattrs structure/unstructure
+
+    python -m benchmarks.deserialize [--lists 2000] [--items 300]
+"""
+
+import argparse
+import json
+import time
+
+from cattr import structure, unstructure
+
+from awesome_crawler.serialize import Output, deserialize, serialize
+from benchmarks.delta_merge import synthetic_outputs
+
+
+def timed(name: str, f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>18}: {elapsed:6.2f}s")
+    return elapsed, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lists", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=300)
+    args = parser.parse_args()
+
+    output, _ = synthetic_outputs(args.lists, args.items)
+    print(f"{args.lists} lists x {args.items} items")
+
+    before, data = timed("cattrs serialize", lambda: json.dumps(unstructure(output)))
+    after, fast = timed("serialize", serialize, output)
+    print(f"identical: {data == fast}, speedup: {before / after:.1f}x")
+
+    before, legacy = timed(
+        "cattrs deserialize", lambda: structure(json.loads(data), Output)
+    )
+    after, decoded = timed("deserialize", deserialize, data)
+    print(f"identical: {decoded == legacy}, speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
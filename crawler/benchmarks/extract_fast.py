@@ -0,0 +1,49 @@
+"""Fast line based extraction vs the mistune AST extractor
+
+    python -m benchmarks.extract_fast [README.md ...] [--repeat 3]
+"""
+import argparse
+import time
+
+from awesome_crawler import extractor
+from benchmarks.corpus import load_corpus
+
+
+def key(items):
+    return sorted((i.name, i.source, i.description) for i in items)
+
+
+def extract_all(corpus: list[str], engine: str):
+    return [extractor.extract(source, engine) for source in corpus]
+
+
+def bench(name: str, engine: str, corpus: list[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        extract_all(corpus, engine)
+    elapsed = (time.perf_counter() - start) / (repeat * len(corpus))
+    print(f"{name:>8}: {elapsed * 1000:8.2f}ms per README")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="*")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.paths)
+    print(f"{len(corpus)} READMEs, {sum(map(len, corpus)) // 1024}KB")
+
+    ast = extract_all(corpus, extractor.ENGINE_AST)
+    fast = extract_all(corpus, extractor.ENGINE_FAST)
+    matching = sum(key(a) == key(f) for a, f in zip(ast, fast))
+    print(f"parity: {matching}/{len(corpus)} READMEs with identical items")
+
+    before = bench("ast", extractor.ENGINE_AST, corpus, args.repeat)
+    after = bench("fast", extractor.ENGINE_FAST, corpus, args.repeat)
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
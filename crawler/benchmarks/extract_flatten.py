@@ -0,0 +1,47 @@
+"""Single pass extraction vs the previous quadratic AST flattening
+
+    python -m benchmarks.extract_flatten [README.md ...] [--repeat 3]
+"""
+import argparse
+import time
+
+from awesome_crawler import extractor
+from benchmarks.corpus import load_corpus
+from benchmarks import legacy_extractor
+
+
+def bench(name: str, extract, asts: list, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for ast in asts:
+            extract(ast)
+    elapsed = (time.perf_counter() - start) / (repeat * len(asts))
+    print(f"{name:>8}: {elapsed * 1000:8.2f}ms per README")
+    return elapsed
+
+
+def extract_legacy(ast):
+    items = map(legacy_extractor.map_list_item, legacy_extractor.find_list_items(ast))
+    return list(filter(None, items))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="*")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.paths)
+    asts = [extractor.markdown_parser()(source) for source in corpus]
+    print(f"{len(corpus)} READMEs, {sum(map(len, corpus)) // 1024}KB, AST only")
+
+    mismatches = sum(extract_legacy(a) != extractor.extract_ast(a) for a in asts)
+    print(f"output mismatches: {mismatches}")
+
+    before = bench("legacy", extract_legacy, asts, args.repeat)
+    after = bench("single", extractor.extract_ast, asts, args.repeat)
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Per-README parse cost with a fresh mistune parser vs the cached one
+
+    python -m benchmarks.extract_parser [README.md ...] [--repeat 5]
+"""
+import argparse
+import time
+
+import mistune
+
+from awesome_crawler import extractor
+from benchmarks.corpus import load_corpus
+
+
+def extract_fresh_parser(source: str):
+    markdown = mistune.create_markdown(renderer="ast")
+    return extractor.extract_ast(markdown(source))
+
+
+def extract_fresh_many(corpus: list[str]):
+    return [extract_fresh_parser(source) for source in corpus]
+
+
+def extract_cached_many(corpus: list[str]):
+    return [extractor.extract(source) for source in corpus]
+
+
+def bench(name: str, extract_many, corpus: list[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        extract_many(corpus)
+    elapsed = (time.perf_counter() - start) / (repeat * len(corpus))
+    print(f"{name:>8}: {elapsed * 1000:8.2f}ms per README")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="*")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.paths)
+    print(f"{len(corpus)} READMEs, {sum(map(len, corpus)) // 1024}KB")
+
+    before = bench("fresh", extract_fresh_many, corpus, args.repeat)
+    after = bench("cached", extract_cached_many, corpus, args.repeat)
+    print(f"speedup: {before / after:.2f}x")
+
+    small = [min(corpus, key=len)] * 50
+    print("smallest README only:")
+    before = bench("fresh", extract_fresh_many, small, args.repeat)
+    after = bench("cached", extract_cached_many, small, args.repeat)
+    print(f"speedup: {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Compare README resolution against the previous full-tree traversal
+
+    python -m benchmarks.readme_lookup [--files 5000] [--commits 50]
+"""
+import argparse
+import subprocess
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import git
+
+from awesome_crawler import awesome_repo
+
+
+def find_readme_file_traverse(commit):
+    filenames = [p.path for p in commit.tree.traverse()]
+
+    readmes = [f for f in filenames if "readme" in f.lower()]
+    if readmes:
+        return readmes[0]
+    else:
+        return None
+
+
+def build_repo(dest: Path, files: int, commits: int) -> git.Repo:
+    repo = git.Repo.init(dest)
+    for i in range(files):
+        path = dest / f"dir{i % 50}" / f"sub{i % 7}" / f"file{i}.md"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(str(i))
+    (dest / "README.md").write_text("- [ITEM](http://item.com)\n")
+
+    env = {
+        "GIT_AUTHOR_NAME": "bench",
+        "GIT_AUTHOR_EMAIL": "bench@example.com",
+        "GIT_COMMITTER_NAME": "bench",
+        "GIT_COMMITTER_EMAIL": "bench@example.com",
+    }
+    for i in range(commits):
+        (dest / "CHANGELOG").write_text(str(i))
+        subprocess.run(["git", "add", "-A"], cwd=dest, check=True)
+        subprocess.run(
+            ["git", "commit", "-q", "-m", f"commit {i}"], cwd=dest, env=env, check=True
+        )
+    return repo
+
+
+def bench(name: str, find, commits) -> float:
+    start = time.perf_counter()
+    for commit in commits:
+        find(commit)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>10}: {elapsed * 1000:8.1f}ms ({elapsed / len(commits) * 1e6:.0f}us/commit)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--commits", type=int, default=50)
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as temp:
+        repo = build_repo(Path(temp), args.files, args.commits)
+        commits = list(repo.iter_commits())
+        print(f"{len(commits)} commits, {args.files} files per tree")
+
+        before = bench("traverse", find_readme_file_traverse, commits)
+        awesome_repo._readme_paths.clear()
+        after = bench("indexed", awesome_repo.find_readme_file, commits)
+        print(f"speedup: {before / after:.0f}x")
+        repo.close()
+
+
+if __name__ == "__main__":
+    main()
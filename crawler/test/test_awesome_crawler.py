@@ -1,9 +1,19 @@
+import dataclasses
+import io
 import json
+import sys
 from datetime import datetime
+from unittest import mock
 
-from awesome_crawler.extractor import ExtractInfo, extract
-from awesome_crawler.output import generate_json_str
+from botocore.exceptions import ClientError
+
+from awesome_crawler.extractor import ENGINE_FAST, ExtractInfo, extract
+from awesome_crawler import output
+from awesome_crawler.delta import load_current
+from awesome_crawler.output import generate_json_str, stream_lists
 from awesome_crawler.process import AwesomeItem, AwesomeList
+from awesome_crawler.serialize import Output, OutputItem, OutputList, serialize
+from benchmarks import legacy_extractor
 
 
 def test_extract() -> None:
@@ -19,6 +29,96 @@ def test_extract() -> None:
     assert "DeepfakeHTTP is a web server" in deepfake.description
 
 
+def test_extract_matches_legacy_extractor() -> None:
+    markdown = exampleMarkdown() + """
+## Nested
+- [**Bold** name](http://bold.com) - with [another](http://another.com) link
+  - [Child](http://child.com) - nested item
+    - [Grandchild](http://grandchild.com) `code`
+- Plain item without a link
+- [Anchor](#anchor)
+1. [Ordered](http://ordered.com) - ordered
+
+  Loose paragraph item
+"""
+
+    assert extract(markdown) == legacy_extractor.extract(markdown)
+
+
+def test_fast_extract_matches_ast() -> None:
+    markdown = exampleMarkdown() + """
+### Formatted
+- [**Bold**](http://bold.com) - falls back to the AST
+- [Reference](http://ref.com?a=1&b=2) - escaped url
+```
+- [InCode](http://code.com) - not an item
+```
+
+### Loose
+- [Before](http://before.com) - the list is loose
+
+- [Parent](http://parent.com) - with a nested list
+  - [Child](http://child.com) - nested
+- [After](http://after.com) - back to the fast path
+"""
+
+    def key(items):
+        return sorted((i.name, i.source, i.description) for i in items)
+
+    assert key(extract(markdown, ENGINE_FAST)) == key(extract(markdown))
+
+
+def test_fast_extract_category() -> None:
+    actual = extract(exampleMarkdown(), ENGINE_FAST)
+
+    categories = {i.name: i.category for i in actual}
+    assert categories["BeEF"] == "Security"
+    assert categories["DeepfakeHTTP"] == "Make your life easier"
+
+
+def test_fast_extract_parses_the_whole_document_when_lists_are_unclear() -> None:
+    markdown = """## Tools
+- [A](http://a.com) - a
+- [B](http://b.com) - b
+  - [C](http://c.com) - c
+"""
+
+    with mock.patch("awesome_crawler.mistune_compat.list_items", return_value=None):
+        actual = extract(markdown, ENGINE_FAST)
+
+    expected = [dataclasses.replace(i, category="Tools") for i in extract(markdown)]
+    assert actual == expected
+
+
+def test_fast_extract_keeps_categories_of_documents_with_reference_links() -> None:
+    markdown = """# Awesome
+[![Awesome](badge.svg)][awesome]
+
+## Tools
+- [A](http://a.com) - a
+
+## Libraries
+- [B][b] - b
+
+[awesome]: https://awesome.re
+[b]: http://b.com
+"""
+
+    actual = extract(markdown, ENGINE_FAST)
+
+    assert {i.name: (i.source, i.category) for i in actual} == {
+        "A": ("http://a.com", "Tools"),
+        "B": ("http://b.com", "Libraries"),
+    }
+
+
+def test_ast_extract_does_not_need_the_mistune_internals() -> None:
+    with mock.patch.dict(sys.modules, {"awesome_crawler.mistune_compat": None}):
+        actual = extract("- [A](http://a.com) - a")
+
+    assert [i.name for i in actual] == ["A"]
+
+
 def test_output():
     items = [
         AwesomeItem(
@@ -74,6 +174,64 @@ def test_output():
     assert actual_json == expect
 
 
+def awesome_items(list_name: str, names: list[str]) -> list[AwesomeItem]:
+    awesomeList = AwesomeList(list_name, f"http://{list_name}.com", "")
+    time = datetime.strptime("26 Sep 2020", r"%d %b %Y")
+    return [
+        AwesomeItem(
+            ExtractInfo(name, f"http://{name}.com", "", None), awesomeList, time
+        )
+        for name in names
+    ]
+
+
+def test_stream_lists_merges_each_list_into_the_old_output():
+    old_items = [OutputItem("ITEM1", "http://ITEM1.com", "", "old")]
+    old = Output(
+        [OutputList("LIST1", "", "", old_items), OutputList("OLD", "", "", [])]
+    )
+    results = [
+        awesome_items("LIST2", ["ITEM2"]),
+        [],
+        awesome_items("LIST1", ["ITEM2", "ITEM1"]),
+    ]
+
+    lists = list(stream_lists(iter(results), old))
+
+    assert [output_list.name for output_list in lists] == ["LIST2", "LIST1", "OLD"]
+    assert [(i.name, i.time) for i in lists[1].items] == [
+        ("ITEM1", "old"),
+        ("ITEM2", "2020-09-26T00:00:00"),
+    ]
+
+
+def test_stream_lists_gathers_held_back_lists():
+    results = [awesome_items("LIST1", ["ITEM2"]), awesome_items("LIST1", ["ITEM1"])]
+
+    lists = list(stream_lists(iter(results), Output([]), {"LIST1"}))
+
+    assert len(lists) == 1
+    assert [i.name for i in lists[0].items] == ["ITEM1", "ITEM2"]
+
+
+def test_journal_entry_keeps_the_name_a_repository_is_stored_with():
+    old = Output(
+        [
+            OutputList(
+                "OLD",
+                "https://list1.com/",
+                "",
+                [OutputItem("ITEM1", "http://ITEM1.com", "", "old")],
+            )
+        ]
+    )
+
+    entry = output.journal_entry(iter([awesome_items("LIST1", ["ITEM1", "ITEM2"])]), old)
+
+    assert [output_list.name for output_list in entry.lists] == ["OLD"]
+    assert [i.name for i in entry.lists[0].items] == ["ITEM2"]
+
+
 def exampleMarkdown() -> str:
     return """
 ![](https://github.com/TheJambo/awesome-testing/blob/master/AwesomeTesting.jpg?raw=true)
@@ -126,3 +284,210 @@ Finally, I'm sure everyone who reads this list has one thing they want to add. P
 - [Requestly](https://requestly.io/) - A lightweight proxy as a browser extension & desktop app to intercept & modify network requests. You can Modify Headers, Redirect Url, Mock API response, Delay/Throttle requests, etc.
 - [DeepfakeHTTP](https://github.com/xnbox/DeepfakeHTTP) - DeepfakeHTTP is a web server that uses HTTP dumps as a source for responses. This tool allows you to test clients against REST, GraphQL, and other APIs.
 """
+
+
+class FakeS3:
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self):
+        self.objects: dict[str, bytes] = {}
+        self.headers: dict[str, dict] = {}
+        self.downloads: list[str] = []
+
+    def put_object(self, Body, Bucket, Key, **headers):
+        if isinstance(Body, str):
+            Body = Body.encode()
+        self.objects[Key] = Body if isinstance(Body, bytes) else Body.read()
+        self.headers[Key] = headers
+
+    def create_multipart_upload(self, Bucket, Key, **headers):
+        self.parts: dict[int, bytes] = {}
+        self.headers[Key] = headers
+        return {"UploadId": "UPLOAD"}
+
+    def upload_part(self, Bucket, Key, PartNumber, UploadId, Body):
+        self.parts[PartNumber] = Body
+        return {"ETag": f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        self.objects[Key] = b"".join(self.parts[number] for number in numbers)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.parts = {}
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey()
+        etag = f'"{hash(self.objects[Key])}"'
+        if IfNoneMatch == etag:
+            raise ClientError({"Error": {"Code": "304"}}, "GetObject")
+        self.downloads.append(Key)
+        return {
+            "Body": io.BytesIO(self.objects[Key]),
+            "ETag": etag,
+            **self.headers.get(Key, {}),
+        }
+
+
+def test_journal_entries_rebuild_the_output():
+    s3 = FakeS3()
+    s3.objects["data.json"] = serialize(Output([])).encode()
+    runs = [["ITEM1"], ["ITEM1", "ITEM2"], ["ITEM2", "ITEM3"]]
+
+    with mock.patch("boto3.client", return_value=s3), mock.patch.object(
+        output, "notify_backend_reload"
+    ), mock.patch.object(output, "COMPACT_EVERY", 2), mock.patch.object(
+        output, "datetime"
+    ) as now:
+        for run, names in enumerate(runs):
+            now.now.return_value = datetime(2020, 9, 26 + run)
+            output.generate_json(iter([awesome_items("LIST1", names)]))
+
+        current = load_current()
+
+    journal = json.loads(s3.objects["journal.json"])
+    assert journal == {
+        "snapshot": "20200927T000000Z",
+        "entries": ["journal/20200928T000000Z.json"],
+        "layout": "monolithic",
+    }
+    assert [i.name for i in current.lists[0].items] == ["ITEM1", "ITEM2", "ITEM3"]
+    entry = json.loads(s3.objects["journal/20200928T000000Z.json"])
+    assert [i["name"] for i in entry["lists"][0]["items"]] == ["ITEM3"]
+
+
+def test_sharded_snapshot_only_uploads_changed_lists():
+    s3 = FakeS3()
+    s3.objects["data.json"] = serialize(Output([])).encode()
+    runs = [{"LIST1": ["ITEM1"], "LIST2": ["ITEM1"]}, {"LIST2": ["ITEM2"]}]
+
+    with mock.patch("boto3.client", return_value=s3), mock.patch.object(
+        output, "notify_backend_reload"
+    ), mock.patch.object(output, "COMPACT_EVERY", 1), mock.patch.object(
+        output, "datetime"
+    ) as now:
+        for run, lists in enumerate(runs):
+            now.now.return_value = datetime(2020, 9, 26 + run)
+            results = iter([awesome_items(name, names) for name, names in lists.items()])
+            output.generate_json(results, layout="sharded")
+            if run == 0:
+                first = dict(s3.objects)
+
+        current = load_current()
+
+    journal = json.loads(s3.objects["journal.json"])
+    assert journal["layout"] == "sharded"
+    manifest = json.loads(s3.objects["manifest.json"])
+    assert [shard["name"] for shard in manifest["shards"]] == ["LIST1", "LIST2"]
+    shards = {key for key in s3.objects if key.startswith("shards/")}
+    assert len(shards) == 3
+    assert len(shards - set(first)) == 1
+    assert [[i.name for i in lst.items] for lst in current.lists] == [
+        ["ITEM1"],
+        ["ITEM1", "ITEM2"],
+    ]
+
+
+def test_compressed_journal_entries_rebuild_the_output():
+    s3 = FakeS3()
+    s3.objects["data.json"] = serialize(Output([])).encode()
+    runs = [["ITEM1"], ["ITEM2"], ["ITEM3"]]
+
+    with mock.patch("boto3.client", return_value=s3), mock.patch.object(
+        output, "notify_backend_reload"
+    ), mock.patch.object(output, "COMPACT_EVERY", 2), mock.patch.object(
+        output, "datetime"
+    ) as now:
+        for run, names in enumerate(runs):
+            now.now.return_value = datetime(2020, 9, 26 + run)
+            results = iter([awesome_items("LIST1", names)])
+            output.generate_json(results, codec="msgpack+zstd")
+
+        current = load_current()
+
+    assert s3.headers["data.json"] == {
+        "ContentType": "application/msgpack",
+        "ContentEncoding": "zstd",
+    }
+    assert [i.name for i in current.lists[0].items] == ["ITEM1", "ITEM2", "ITEM3"]
+
+
+def test_load_current_only_downloads_what_changed(tmp_path):
+    s3 = FakeS3()
+    s3.objects["data.json"] = serialize(Output([])).encode()
+
+    with mock.patch("boto3.client", return_value=s3), mock.patch.object(
+        output, "notify_backend_reload"
+    ):
+        output.generate_json(iter([awesome_items("LIST1", ["ITEM1"])]))
+        first = load_current(tmp_path)
+        s3.downloads.clear()
+        second = load_current(tmp_path)
+        s3.objects["data.json"] = serialize(first).encode()
+        third = load_current(tmp_path)
+
+    assert first == second == third
+    assert s3.downloads == ["journal.json", "journal.json", "data.json"]
+
+
+def test_load_current_reads_cached_shards_without_asking_s3(tmp_path):
+    s3 = FakeS3()
+    s3.objects["data.json"] = serialize(Output([])).encode()
+
+    with mock.patch("boto3.client", return_value=s3), mock.patch.object(
+        output, "notify_backend_reload"
+    ), mock.patch.object(output, "COMPACT_EVERY", 1), mock.patch.object(
+        output, "datetime"
+    ) as now:
+        now.now.return_value = datetime(2020, 9, 26)
+        output.generate_json(iter([awesome_items("LIST1", ["ITEM1"])]), layout="sharded")
+        load_current(tmp_path)
+        now.now.return_value = datetime(2020, 9, 27)
+        output.generate_json(iter([awesome_items("LIST2", ["ITEM1"])]), layout="sharded")
+        with mock.patch.object(s3, "get_object", wraps=s3.get_object) as get_object:
+            current = load_current(tmp_path)
+
+    shards = [c.kwargs["Key"] for c in get_object.call_args_list]
+    shards = [key for key in shards if key.startswith("shards/")]
+    assert len(shards) == 1
+    assert [lst.name for lst in current.lists] == ["LIST1", "LIST2"]
+    cached = {f"shards/{path.name}" for path in (tmp_path / "s3" / "shards").iterdir()}
+    manifest = json.loads(s3.objects["manifest.json"])
+    assert cached == {
+        key
+        for shard in manifest["shards"]
+        for key in (shard["key"], f"{shard['key']}.headers")
+    }
+
+
+def test_multipart_upload_streams_the_encoder_output():
+    s3 = FakeS3()
+    lists = [
+        output.output_list(awesome_items(f"LIST{n}", [f"ITEM{i}" for i in range(50)]))
+        for n in range(20)
+    ]
+    config = output.UploadConfig(part_size=1024, workers=3)
+
+    with output.MultipartUpload(s3, "data.json", {}, config) as f:
+        output.encode_stream(lists, f, "json")
+
+    assert len(s3.parts) > 3
+    assert s3.objects["data.json"] == serialize(Output(lists)).encode()
+
+
+def test_multipart_upload_aborts_on_error():
+    s3 = FakeS3()
+    config = output.UploadConfig(part_size=4, workers=1)
+
+    try:
+        with output.MultipartUpload(s3, "data.json", {}, config) as f:
+            f.write(b"0123456789")
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+
+    assert "data.json" not in s3.objects
+    assert s3.parts == {}
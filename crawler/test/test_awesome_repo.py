@@ -0,0 +1,307 @@
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+import git
+import pytest
+
+from awesome_crawler import awesome_repo, process
+from awesome_crawler.awesome_repo import (
+    CLONE_PARTIAL,
+    CLONE_SHALLOW,
+    clone,
+    extract_all_commits,
+    extract_incremental,
+    fetch_awesome_repo,
+    find_readme_file,
+    mirror_path,
+    parse_awesome_repo,
+    process_awesome_repo,
+    update_mirror,
+)
+from awesome_crawler.process import (
+    AwesomeList,
+    CrawlerArgument,
+    crawl_awesome,
+    default_parse_workers,
+    fetch_repository,
+    parse_repository,
+)
+
+ACTOR = git.Actor("crawler", "crawler@example.com")
+
+
+def commit_readme(repo: git.Repo, content: str, date: str):
+    readme = f"{repo.working_tree_dir}/README.md"
+    with open(readme, "w") as f:
+        f.write(content)
+    repo.index.add([readme])
+    repo.index.commit(
+        "update readme",
+        author=ACTOR,
+        committer=ACTOR,
+        author_date=date,
+        commit_date=date,
+    )
+
+
+def commit_files(repo: git.Repo, paths: list[str]):
+    for path in paths:
+        full = Path(str(repo.working_tree_dir)) / path
+        full.parent.mkdir(parents=True, exist_ok=True)
+        full.write_text(path)
+    repo.index.add(paths)
+    return repo.index.commit("add files", author=ACTOR, committer=ACTOR)
+
+
+@pytest.fixture
+def awesome_git_repo(tmp_path):
+    repo = git.Repo.init(tmp_path / "awesome")
+    commit_readme(repo, "- [ITEM1](http://item1.com) - one\n", "2020-09-26T00:00:00")
+    return repo
+
+
+def test_process_without_cache(awesome_git_repo):
+    items = list(process_awesome_repo(awesome_git_repo.working_tree_dir))
+
+    assert [i.item.name for i in items] == ["ITEM1"]
+
+
+def test_mirror_only_walks_new_commits(awesome_git_repo, tmp_path):
+    url = awesome_git_repo.working_tree_dir
+    cache_dir = tmp_path / "cache"
+
+    first = parse_awesome_repo(fetch_awesome_repo(url, tmp_path, cache_dir))
+    assert [i.item.name for i in first.items] == ["ITEM1"]
+    assert first.head == awesome_git_repo.head.commit.hexsha
+    assert mirror_path(url, cache_dir).exists()
+
+    head = first.head
+    assert list(process_awesome_repo(url, cache_dir=cache_dir, since=head)) == []
+    # nothing is remembered until the caller records the head
+    again = process_awesome_repo(url, cache_dir=cache_dir)
+    assert [i.item.name for i in again] == ["ITEM1"]
+
+    commit_readme(
+        awesome_git_repo,
+        "- [ITEM1](http://item1.com) - one\n- [ITEM2](http://item2.com) - two\n",
+        "2020-10-01T00:00:00",
+    )
+    second = list(process_awesome_repo(url, cache_dir=cache_dir, since=head))
+
+    assert sorted(i.item.name for i in second) == ["ITEM1", "ITEM2"]
+    assert all(i.time == datetime(2020, 10, 1) for i in second)
+
+
+def test_mirror_only_fetches_branches(awesome_git_repo, tmp_path):
+    url = awesome_git_repo.working_tree_dir
+    cache_dir = tmp_path / "cache"
+    pull = awesome_git_repo.head.commit
+    awesome_git_repo.create_head("pull", pull)
+    awesome_git_repo.git.update_ref("refs/pull/1/head", pull.hexsha)
+
+    update_mirror(url, cache_dir)
+    commit_readme(awesome_git_repo, "- [ITEM2](http://item2.com)\n", "2020-10-01T00:00:00")
+    mirror = update_mirror(url, cache_dir)
+
+    refs = mirror.git.for_each_ref("--format=%(refname)").split()
+    assert "refs/pull/1/head" not in refs
+    assert "refs/heads/pull" in refs
+    assert mirror.head.commit.hexsha == awesome_git_repo.head.commit.hexsha
+
+
+def test_mirrors_walk_from_the_head_of_the_previous_stats(awesome_git_repo, tmp_path):
+    lists = [AwesomeList("awesome", awesome_git_repo.working_tree_dir, "")]
+
+    def crawl(stats):
+        results = crawl_awesome(lists, cache_dir=tmp_path, parse_workers=1, stats=stats)
+        return list(results)[0]
+
+    first = crawl({})
+    # the run failed before writing its stats: the items are produced again
+    assert [i.item.name for i in crawl({}).items] == ["ITEM1"]
+    assert crawl({"awesome": first.stats}).items == []
+
+
+def test_shallow_clone_only_fetches_limit(awesome_git_repo, tmp_path):
+    commit_readme(awesome_git_repo, "- [ITEM2](http://item2.com)\n", "2020-10-01T00:00:00")
+    url = "file://" + awesome_git_repo.working_tree_dir
+
+    repo = clone(url, tmp_path / "shallow", CLONE_SHALLOW, limit=1)
+
+    assert len(list(repo.iter_commits())) == 1
+
+
+def test_partial_clone(awesome_git_repo):
+    with awesome_git_repo.config_writer() as config:
+        config.set_value("uploadpack", "allowFilter", "true")
+    url = "file://" + awesome_git_repo.working_tree_dir
+
+    items = list(process_awesome_repo(url, clone_mode=CLONE_PARTIAL))
+
+    assert [i.item.name for i in items] == ["ITEM1"]
+
+
+def test_unchanged_readme_is_parsed_once(awesome_git_repo):
+    other = awesome_git_repo.working_tree_dir + "/LICENSE"
+    open(other, "w").close()
+    awesome_git_repo.index.add([other])
+    awesome_git_repo.index.commit("license", author=ACTOR, committer=ACTOR)
+
+    with mock.patch.object(
+        awesome_repo, "extract", wraps=awesome_repo.extract
+    ) as extract:
+        items = list(extract_all_commits(awesome_git_repo))
+
+    assert extract.call_count == 1
+    assert [i.item.name for i in items] == ["ITEM1", "ITEM1"]
+
+
+def test_readme_priority_at_root(tmp_path):
+    repo = git.Repo.init(tmp_path / "repo")
+    commit = commit_files(repo, ["README-zh.md", "README.md", "docs/README.md"])
+
+    assert find_readme_file(commit) == "README.md"
+
+
+def test_readme_found_in_subdirectory(tmp_path):
+    repo = git.Repo.init(tmp_path / "repo")
+    commit = commit_files(repo, ["index.html", "docs/notes.txt", "docs/Readme.md"])
+
+    assert find_readme_file(commit) == "docs/Readme.md"
+
+
+def test_readme_search_is_bounded(tmp_path):
+    repo = git.Repo.init(tmp_path / "repo")
+    commit = commit_files(repo, ["a/b/c/d/README.md"])
+
+    assert find_readme_file(commit) is None
+
+
+def test_incremental_matches_full_history(awesome_git_repo):
+    commit_readme(
+        awesome_git_repo,
+        "- [ITEM1](http://item1.com) - one\n- [ITEM2](http://item2.com) - two\n",
+        "2020-10-01T00:00:00",
+    )
+    commit_readme(
+        awesome_git_repo,
+        "# List\n\n- [ITEM1](http://item1.com) - first\n- [ITEM2](http://item2.com) - two\n",
+        "2020-11-01T00:00:00",
+    )
+
+    full = process_awesome_repo(awesome_git_repo.working_tree_dir)
+    incremental = extract_incremental(awesome_git_repo)
+
+    def by_name(items):
+        return sorted((i.item.name, i.item.description, i.time) for i in items)
+
+    assert by_name(incremental) == by_name(full)
+    assert by_name(incremental)[0][2] == datetime(2020, 9, 26)
+
+
+def test_incremental_from_last_processed(awesome_git_repo):
+    since = awesome_git_repo.head.commit.hexsha
+    commit_readme(
+        awesome_git_repo,
+        "- [ITEM1](http://item1.com) - one\n- [ITEM2](http://item2.com) - two\n",
+        "2020-10-01T00:00:00",
+    )
+
+    items = list(extract_incremental(awesome_git_repo, since=since))
+
+    assert [(i.item.name, i.time) for i in items] == [("ITEM2", datetime(2020, 10, 1))]
+
+
+def test_crawl_awesome_fetches_and_parses_every_list(awesome_git_repo, tmp_path):
+    lists = [
+        AwesomeList("awesome", awesome_git_repo.working_tree_dir, "ok"),
+        AwesomeList("missing", str(tmp_path / "missing"), "fails to clone"),
+    ]
+
+    results = list(crawl_awesome(lists, fetch_workers=2, parse_workers=1))
+
+    items = sorted((i.list.name, i.item.name) for r in results for i in r.items)
+    assert items == [("awesome", "ITEM1")]
+    stats = {r.stats.name: r.stats for r in results}
+    assert stats["awesome"].items == 1
+    assert stats["awesome"].commits == 1
+    assert stats["missing"].items == 0
+
+
+def crash_parsing(argument, path, spent=0.0):
+    """parse_repository, killing its worker process on the list named crash"""
+    if argument.list.name == "crash":
+        os._exit(1)
+    return parse_repository(argument, path, spent)
+
+
+def test_crawl_awesome_survives_a_dead_parse_worker(awesome_git_repo):
+    lists = [
+        AwesomeList("crash", awesome_git_repo.working_tree_dir, ""),
+        AwesomeList("awesome", awesome_git_repo.working_tree_dir, ""),
+    ]
+
+    def fetch_slowly(argument, dest):
+        if argument.list.name != "crash":
+            time.sleep(1)
+        return fetch_repository(argument, dest)
+
+    with mock.patch.object(process, "parse_repository", crash_parsing), mock.patch.object(
+        process, "fetch_repository", fetch_slowly
+    ):
+        results = list(crawl_awesome(lists, fetch_workers=1, parse_workers=1))
+
+    stats = {r.stats.name: r.stats for r in results}
+    assert stats["crash"].items == 0
+    assert stats["awesome"].items == 1
+
+
+def test_default_parse_workers_are_capped():
+    with mock.patch.object(os, "process_cpu_count", return_value=64, create=True):
+        assert default_parse_workers() == process.PARSE_WORKERS
+
+    with mock.patch.object(os, "process_cpu_count", return_value=2, create=True):
+        assert default_parse_workers() == 2
+
+
+def test_parse_repository_records_timeout(awesome_git_repo):
+    argument = CrawlerArgument(
+        AwesomeList("slow", awesome_git_repo.working_tree_dir, ""), None, timeout=5
+    )
+
+    with mock.patch.object(
+        process, "parse_awesome_repo", side_effect=lambda *a, **k: time.sleep(10)
+    ):
+        result = parse_repository(argument, Path(awesome_git_repo.git_dir), spent=4.9)
+
+    assert result.items == []
+    assert result.stats.timed_out
+    assert 5 <= result.stats.duration < 8
+
+
+def test_crawl_awesome_skips_lists_whose_head_did_not_move(awesome_git_repo):
+    lists = [AwesomeList("awesome", awesome_git_repo.working_tree_dir, "")]
+
+    def crawl(stats):
+        results = list(crawl_awesome(lists, parse_workers=1, stats=stats, probe=True))
+        return results[0]
+
+    first = crawl({})
+    second = crawl({"awesome": first.stats})
+    commit_readme(
+        awesome_git_repo,
+        "- [ITEM1](http://item1.com) - one\n- [ITEM2](http://item2.com) - two\n",
+        "2020-09-27T00:00:00",
+    )
+    third = crawl({"awesome": second.stats})
+
+    assert first.stats.head == awesome_git_repo.head.commit.parents[0].hexsha
+    assert [i.item.name for i in first.items] == ["ITEM1"]
+    assert second.items == []
+    assert second.stats.head == first.stats.head
+    assert second.stats.duration == first.stats.duration
+    assert third.stats.head == awesome_git_repo.head.commit.hexsha
+    assert sorted(i.item.name for i in third.items) == ["ITEM1", "ITEM2"]
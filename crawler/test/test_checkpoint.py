@@ -0,0 +1,113 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from awesome_crawler.checkpoint import Checkpoint, latest_run, resume_crawl
+from awesome_crawler.extractor import ExtractInfo
+from awesome_crawler.process import AwesomeItem, AwesomeList, CrawlResult
+from awesome_crawler.stats import ListStats
+
+
+def crawl_result(name: str, items: list[str]) -> CrawlResult:
+    awesomeList = AwesomeList(name, f"https://github.com/owner/{name}", "")
+    time = datetime(2020, 9, 26, tzinfo=timezone.utc)
+    return CrawlResult(
+        [
+            AwesomeItem(ExtractInfo(i, f"http://{i}.com", "", None), awesomeList, time)
+            for i in items
+        ],
+        ListStats(name, 1.5, 3, len(items), crawled="2020-09-26T00:00:00", head="abc"),
+        awesomeList,
+    )
+
+
+def test_results_round_trip(tmp_path):
+    checkpoint = Checkpoint(tmp_path, "run")
+    checkpoint.start(resume=False)
+    result = crawl_result("LIST1", ["ITEM1", "ITEM2"])
+
+    checkpoint.save(result)
+
+    assert list(checkpoint.load([result.list])) == [result]
+
+
+def test_resume_only_crawls_the_lists_not_finished(tmp_path):
+    lists = [crawl_result(name, []).list for name in ["LIST1", "LIST2", "LIST3"]]
+    crawled = []
+
+    def crawl(repos, killed_after=None):
+        crawled.append([repo.name for repo in repos])
+        for count, repo in enumerate(repos):
+            if count == killed_after:
+                raise MemoryError("killed")
+            yield crawl_result(repo.name, [f"{repo.name}-ITEM"])
+
+    checkpoint = Checkpoint(tmp_path, "run")
+    checkpoint.start(resume=False)
+    results = resume_crawl(checkpoint, lists, lambda repos: crawl(repos, 2))
+    with pytest.raises(MemoryError):
+        list(results)
+
+    resumed = Checkpoint(tmp_path, "run")
+    resumed.start(resume=True)
+    results = list(resume_crawl(resumed, lists, crawl))
+
+    assert crawled == [["LIST1", "LIST2", "LIST3"], ["LIST3"]]
+    assert results == [
+        crawl_result(name, [f"{name}-ITEM"]) for name in ["LIST1", "LIST2", "LIST3"]
+    ]
+
+
+def test_resuming_never_drops_other_runs(tmp_path):
+    result = crawl_result("LIST1", ["ITEM1"])
+    # killed just before midnight, resumed the next day
+    interrupted = Checkpoint(tmp_path, "20201001T235000Z")
+    interrupted.start(resume=False)
+    interrupted.save(result)
+
+    run = latest_run(tmp_path)
+    resumed = Checkpoint(tmp_path, run)
+    resumed.start(resume=True)
+
+    assert run == "20201001T235000Z"
+    assert resumed.finished(result.list)
+
+
+def test_starting_over_only_drops_the_run_itself(tmp_path):
+    result = crawl_result("LIST1", ["ITEM1"])
+    other = Checkpoint(tmp_path, "other")
+    other.start(resume=False)
+    other.save(result)
+    current = Checkpoint(tmp_path, "run")
+    current.start(resume=False)
+    current.save(result)
+
+    Checkpoint(tmp_path, "run").start(resume=False)
+
+    assert not current.finished(result.list)
+    assert other.finished(result.list)
+
+
+def test_clear_drops_the_run_and_the_ones_before(tmp_path):
+    ids = ["20201001T000000Z", "20201002T000000Z", "20201003T000000Z"]
+    runs = [Checkpoint(tmp_path, run) for run in ids]
+    for run in runs:
+        run.start(resume=False)
+
+    runs[1].clear()
+
+    assert [run.path.exists() for run in runs] == [False, False, True]
+    assert latest_run(tmp_path) == ids[2]
+    runs[2].clear()
+    assert latest_run(tmp_path) is None
+
+
+def test_clear_keeps_runs_with_their_own_ids(tmp_path):
+    ids = ["20201001T000000Z", "0-named", "20201002T000000Z"]
+    runs = [Checkpoint(tmp_path, run) for run in ids]
+    for run in runs:
+        run.start(resume=False)
+
+    runs[2].clear()
+
+    assert [run.path.exists() for run in runs] == [False, True, False]
@@ -1,7 +1,14 @@
+import copy
+import random
+from unittest import mock
+
 import pytest
 
-from awesome_crawler.delta import delta
+from awesome_crawler import delta as delta_module
+from awesome_crawler.delta import delta, merge_outputs, reconstruct
 from awesome_crawler.serialize import Output, OutputItem, OutputList, serialize
+from awesome_crawler.urls import AliasIndex
+from benchmarks import legacy_delta
 
 
 @pytest.fixture
@@ -46,3 +53,86 @@ def test_new_lists_should_be_added(old_output_3_items, new_list):
     delta_output = delta(serialize(new_list), serialize(old_output_3_items))
 
     assert len(delta_output.lists) == 2
+
+
+def test_renamed_lists_are_merged_into_their_repository():
+    item = OutputItem("ITEM1", "http://item1.com", "", "")
+    old = Output([OutputList("Old", "https://github.com/old/awesome", "", [item])])
+    new_item = OutputItem("ITEM2", "http://item2.com", "", "")
+    new = Output(
+        [OutputList("New", "https://github.com/New/Awesome#readme", "", [new_item])]
+    )
+    aliases = AliasIndex()
+    aliases.add("https://github.com/old/awesome", "https://github.com/new/awesome")
+
+    merged = merge_outputs(old, new, aliases)
+
+    assert [output_list.name for output_list in merged.lists] == ["Old"]
+    assert [i.name for i in merged.lists[0].items] == ["ITEM1", "ITEM2"]
+    assert len(merge_outputs(old, new).lists) == 2
+
+
+def test_lists_without_a_repository_url_are_matched_by_name():
+    item = OutputItem("ITEM1", "http://item1.com", "", "")
+    old = Output([OutputList("LIST1", "", "", [item])])
+    new = Output([OutputList("LIST2", "", "", [item])])
+
+    assert len(merge_outputs(old, new).lists) == 2
+
+
+def random_output(rng: random.Random, lists: int, items: int) -> Output:
+    return Output(
+        [
+            OutputList(
+                f"LIST{rng.randrange(lists * 2)}",
+                "",
+                "",
+                [
+                    OutputItem(f"ITEM{rng.randrange(items * 2)}", "", "", str(n))
+                    for _ in range(rng.randrange(items))
+                ],
+            )
+            for n in range(lists)
+        ]
+    )
+
+
+def test_delta_without_old_data_merges_into_the_current_data(
+    old_output_3_items, new_list
+):
+    with mock.patch.object(
+        delta_module, "load_current", return_value=old_output_3_items
+    ) as load_current:
+        delta_output = delta(serialize(new_list))
+
+    load_current.assert_called_once_with()
+    assert [lst.name for lst in delta_output.lists] == ["LIST1", "LIST2"]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_delta_matches_legacy_delta(seed):
+    rng = random.Random(seed)
+    new = serialize(random_output(rng, 30, 20))
+    old = serialize(random_output(rng, 30, 20))
+
+    assert delta(new, old) == legacy_delta.delta(new, old)
+
+
+def test_merge_does_not_modify_outputs(old_output_3_items, new_output_4_items):
+    old = copy.deepcopy(old_output_3_items)
+    new = copy.deepcopy(new_output_4_items)
+
+    merge_outputs(old, new)
+
+    assert old == old_output_3_items
+    assert new == new_output_4_items
+
+
+def test_reconstruct_applies_entries_in_order(old_output_3_items, new_list):
+    entry = Output([OutputList("LIST1", "", "", [OutputItem("ITEM9", "", "", "")])])
+
+    current = reconstruct(old_output_3_items, [entry, new_list, entry])
+
+    assert [output_list.name for output_list in current.lists] == ["LIST1", "LIST2"]
+    assert [i.name for i in current.lists[0].items][-1] == "ITEM9"
+    assert len(current.lists[0].items) == 4
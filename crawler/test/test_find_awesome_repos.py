@@ -0,0 +1,202 @@
+import json
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+import requests
+
+from awesome_crawler import find_awesome_repos, urls
+from awesome_crawler.awesome_repo import AwesomeItemTime
+from awesome_crawler.extractor import ExtractInfo
+from awesome_crawler.find_awesome_repos import (
+    FIRST_CREATED,
+    PER_PAGE,
+    SEARCH_CAP,
+    GithubSearch,
+    HttpCache,
+    RateLimit,
+    find_repos,
+    from_awesome_awesome,
+    stored_names,
+    unique_repositories,
+)
+from awesome_crawler.process import AwesomeList
+from awesome_crawler.serialize import Output, OutputList
+from awesome_crawler.urls import AliasIndex
+
+
+def fake_results(created: list[date]):
+    """`GithubSearch.get` over repositories created on the given dates"""
+
+    def get(query: str, page: int = 1) -> dict:
+        start, end = (date.fromisoformat(d) for d in query.split("created:")[1].split(".."))
+        ids = [i for i, day in enumerate(created) if start <= day <= end]
+        shown = ids[:SEARCH_CAP][(page - 1) * PER_PAGE : page * PER_PAGE]
+        return {"total_count": len(ids), "items": [{"id": i} for i in shown]}
+
+    return get
+
+
+def test_search_splits_queries_over_the_result_cap():
+    created = [date(2015, 1, 1)] * 900 + [date(2020, 6, 1)] * 900 + [date.today()] * 5
+    search = GithubSearch()
+
+    with mock.patch.object(search, "get", side_effect=fake_results(created)) as get:
+        repos = search.search("topic:awesome-list")
+
+    assert sorted(repo["id"] for repo in repos) == list(range(len(created)))
+    first_pages = [c for c in get.call_args_list if len(c.args) == 1]
+    assert all("created:" in c.args[0] for c in first_pages)
+    assert FIRST_CREATED.isoformat() in first_pages[0].args[0]
+
+
+def test_rate_limit_waits_for_the_reset():
+    rate_limit = RateLimit()
+    response = requests.Response()
+    response.headers["X-RateLimit-Remaining"] = "0"
+    response.headers["X-RateLimit-Reset"] = str(time.time() + 30)
+    rate_limit.update(response)
+
+    with mock.patch("time.sleep") as sleep:
+        rate_limit.acquire()
+        rate_limit.acquire()
+
+    sleep.assert_called_once()
+    assert 29 <= sleep.call_args.args[0] <= 31
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    """A stand-in for the search API with one page, answering 304 to its ETag"""
+
+    etag = '"v1"'
+    requests: list[int] = []
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == self.etag:
+            self.requests.append(304)
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.requests.append(200)
+        body = json.dumps({"total_count": 1, "items": [{"id": 1}]}).encode()
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_unchanged_pages_are_read_from_the_cache(tmp_path):
+    server = HTTPServer(("127.0.0.1", 0), SearchHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/search/repositories"
+
+    try:
+        with mock.patch.object(find_awesome_repos, "SEARCH_URL", url):
+            for _ in range(2):
+                search = GithubSearch(cache=HttpCache(tmp_path))
+                assert search.get("topic:awesome-list") == {
+                    "total_count": 1,
+                    "items": [{"id": 1}],
+                }
+    finally:
+        server.shutdown()
+
+    assert SearchHandler.requests == [200, 304]
+
+
+def test_awesome_awesome_is_reused_while_its_head_does_not_move(tmp_path):
+    item = AwesomeItemTime(ExtractInfo("LIST1", "http://list1", "", None), None)
+
+    with mock.patch.object(
+        find_awesome_repos, "remote_head", side_effect=["A", "A", "B"]
+    ), mock.patch.object(
+        find_awesome_repos, "process_awesome_repo", return_value=[item]
+    ) as process:
+        runs = [from_awesome_awesome(tmp_path) for _ in range(3)]
+
+    assert runs[0] == runs[1] == runs[2] == [AwesomeList("LIST1", "http://list1", "")]
+    assert process.call_count == 2
+
+
+def test_each_repository_is_listed_once():
+    aliases = AliasIndex()
+    aliases.add("https://github.com/old/awesome", "https://github.com/new/awesome")
+    repos = [
+        AwesomeList("Awesome", "https://github.com/new/awesome#readme", "first"),
+        AwesomeList("awesome", "https://github.com/New/Awesome", "topic"),
+        AwesomeList("old", "https://github.com/old/awesome", "renamed"),
+        AwesomeList("local", "", ""),
+        AwesomeList("local", "", ""),
+    ]
+
+    unique = unique_repositories(repos, aliases)
+
+    assert unique == [
+        AwesomeList("Awesome", "https://github.com/new/awesome", "first"),
+        AwesomeList("local", "", ""),
+        AwesomeList("local", "", ""),
+    ]
+
+
+def test_renamed_repositories_keep_their_stored_name():
+    aliases = AliasIndex()
+    aliases.add("https://github.com/old/awesome", "https://github.com/new/awesome")
+    stored = Output([OutputList("Old", "https://github.com/old/awesome", "", [])])
+    repos = [
+        AwesomeList("New", "https://github.com/new/awesome", ""),
+        AwesomeList("Other", "https://github.com/other/awesome", ""),
+    ]
+
+    assert [repo.name for repo in stored_names(repos, stored, aliases)] == [
+        "Old",
+        "Other",
+    ]
+
+
+def test_only_awesome_awesome_links_are_checked_for_redirects():
+    awesome_awesome = [AwesomeList("Old", "https://github.com/old/awesome", "")]
+    topics = [
+        AwesomeList("new", "https://github.com/new/awesome", ""),
+        AwesomeList("other", "https://github.com/other/awesome", ""),
+    ]
+    aliases = AliasIndex()
+
+    with mock.patch.object(
+        find_awesome_repos, "from_awesome_awesome", return_value=awesome_awesome
+    ), mock.patch.object(
+        find_awesome_repos, "from_github_topics", return_value=topics
+    ), mock.patch.object(
+        urls, "redirect_target", return_value="https://github.com/new/awesome"
+    ) as redirect_target:
+        repos = find_repos(aliases=aliases)
+
+    redirect_target.assert_called_once_with("https://github.com/old/awesome")
+    assert [repo.name for repo in repos] == ["Old", "other"]
+
+
+def test_stored_lists_discovery_did_not_find_are_checked_for_redirects():
+    stored = Output(
+        [
+            OutputList("Old", "https://github.com/old/awesome", "", []),
+            OutputList("Other", "https://github.com/other/awesome", "", []),
+        ]
+    )
+    repos = [
+        AwesomeList("New", "https://github.com/new/awesome", ""),
+        AwesomeList("Other", "https://github.com/other/awesome", ""),
+    ]
+
+    with mock.patch.object(
+        urls, "redirect_target", return_value="https://github.com/new/awesome"
+    ) as redirect_target:
+        named = stored_names(repos, stored, AliasIndex())
+
+    redirect_target.assert_called_once_with("https://github.com/old/awesome")
+    assert [repo.name for repo in named] == ["Old", "Other"]
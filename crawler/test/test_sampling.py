@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+
+from awesome_crawler.process import AwesomeList
+from awesome_crawler.sampling import (
+    BUCKET_NAMES,
+    classify,
+    get_last_update_time,
+    last_update_index,
+    schedule_repositories,
+)
+from awesome_crawler.serialize import Output, OutputItem, OutputList
+from awesome_crawler.stats import ListStats
+
+
+def output_list(name: str, times: list[str]) -> OutputList:
+    items = [OutputItem(f"ITEM{i}", "", "", time) for i, time in enumerate(times)]
+    return OutputList(name, "", "", items)
+
+
+def test_last_update_index_matches_parsing_every_item():
+    lists = [
+        output_list("LIST1", ["2020-09-26T10:00:00", "2021-01-02T00:00:00", "2020-12-31"]),
+        output_list("LIST2", []),
+        output_list("LIST3", ["2020-09-26T10:00:00", "not a date"]),
+    ]
+
+    index = last_update_index(Output(lists))
+
+    assert index == {lst.name: get_last_update_time(lst) for lst in lists}
+
+
+def test_classify_buckets_lists_by_age():
+    now = datetime.now()
+    ages = [10, 100, 500, 2000]
+    last_updates = {f"LIST{age}": now - timedelta(days=age) for age in ages}
+    repos = [AwesomeList(name, "", "") for name in [*last_updates, "NEW"]]
+
+    buckets = classify(repos, last_updates)
+
+    assert [BUCKET_NAMES[b] for b in buckets[:-1]] == BUCKET_NAMES
+    assert buckets[-1] is None
+
+
+def days_ago(days: float) -> str:
+    return (datetime.now() - timedelta(days=days)).isoformat(timespec="seconds")
+
+
+def scheduled(budget_lists=None, budget_seconds=None) -> list[str]:
+    lists = [
+        # an item a day for the last 100 days, crawled 5 days ago
+        output_list("ACTIVE", [days_ago(day) for day in range(100)]),
+        # an item a week, crawled 10 days ago
+        output_list("WEEKLY", [days_ago(day) for day in range(0, 300, 7)]),
+        # nothing new for years, crawled 20 days ago
+        output_list("STALE", [days_ago(1000)]),
+        output_list("QUIET", [days_ago(1000)]),
+    ]
+    stats = {
+        "ACTIVE": ListStats("ACTIVE", 10, 0, 0, crawled=days_ago(5)),
+        "WEEKLY": ListStats("WEEKLY", 100, 0, 0, crawled=days_ago(10)),
+        "STALE": ListStats("STALE", 10, 0, 0, crawled=days_ago(20)),
+        "QUIET": ListStats("QUIET", 10, 0, 0, crawled=days_ago(2)),
+    }
+    repos = [AwesomeList(name, "", "") for name in [*stats, "NEW"]]
+
+    selected = schedule_repositories(
+        repos, Output(lists), stats, budget_lists, budget_seconds
+    )
+
+    return [repo.name for repo in selected]
+
+
+def test_schedule_crawls_overdue_lists_and_those_expected_to_change():
+    assert scheduled() == ["ACTIVE", "WEEKLY", "STALE", "NEW"]
+
+
+def test_schedule_fills_the_budget_by_expected_changes():
+    assert scheduled(budget_lists=2) == ["STALE", "NEW"]
+    assert scheduled(budget_lists=3) == ["ACTIVE", "STALE", "NEW"]
+    assert scheduled(budget_seconds=125) == ["ACTIVE", "STALE", "QUIET", "NEW"]
+
+
+def test_schedule_fits_new_lists_in_a_time_budget():
+    stats = {
+        "FAST": ListStats("FAST", 10, 0, 0, crawled=days_ago(1)),
+        "SLOW": ListStats("SLOW", 1000, 0, 0, crawled=days_ago(1)),
+        "OTHER": ListStats("OTHER", 10, 0, 0, crawled=days_ago(1)),
+    }
+    repos = [AwesomeList(name, "", "") for name in [*stats, "NEW"]]
+
+    selected = schedule_repositories(repos, Output([]), stats, budget_seconds=50)
+
+    assert [repo.name for repo in selected] == ["FAST", "OTHER", "NEW"]
+
+
+def test_lists_crawled_together_are_not_all_due_together():
+    names = [f"LIST{n}" for n in range(1000)]
+    repos = [AwesomeList(name, "", "") for name in names]
+
+    # the lists due each day after they were all crawled
+    due = []
+    for day in range(1, 15):
+        stats = {name: ListStats(name, 10, 0, 0, crawled=days_ago(day)) for name in names}
+        due.append(len(schedule_repositories(repos, Output([]), stats)))
+
+    assert due[-1] == len(names)
+    assert max(b - a for a, b in zip([0, *due], due)) < len(names) / 2
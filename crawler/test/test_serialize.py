@@ -1,13 +1,23 @@
+import io
 import json
 
 import pytest
+from cattr import structure, unstructure
 
 from awesome_crawler.serialize import (
+    CODECS,
     Output,
     OutputItem,
     OutputList,
+    codec_of,
+    content_headers,
+    decode,
     deserialize,
+    deserialize_shard,
+    encode,
     serialize,
+    serialize_shard,
+    serialize_stream,
 )
 
 
@@ -29,3 +39,36 @@ def test_unserialize(output):
     o = deserialize(s)
 
     assert o == output
+
+
+def test_serialize_stream_matches_serialize(output):
+    out = io.StringIO()
+    serialize_stream(iter(output.lists * 2), out)
+
+    assert out.getvalue() == serialize(Output(output.lists * 2))
+
+
+def test_shard_round_trip_and_hash(output):
+    data, digest = serialize_shard(output.lists[0])
+
+    assert deserialize_shard(data) == output.lists[0]
+    assert serialize_shard(output.lists[0]) == (data, digest)
+    assert serialize_shard(OutputList("LIST2", "", "", []))[1] != digest
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_codecs_round_trip(output, codec):
+    data = encode(output, codec)
+
+    assert decode(data, codec) == output
+    assert codec_of(content_headers(codec)) == codec
+
+
+def test_json_codec_matches_serialize(output):
+    assert encode(output).decode() == serialize(output)
+    assert codec_of({"ContentType": "binary/octet-stream"}) == "json"
+
+
+def test_fast_path_matches_cattrs(output):
+    assert json.loads(serialize(output)) == unstructure(output)
+    assert deserialize(serialize(output)) == structure(unstructure(output), Output)
@@ -0,0 +1,68 @@
+from awesome_crawler.stats import (
+    ListStats,
+    deserialize_aliases,
+    deserialize_stats,
+    estimate_costs,
+    merge_stats,
+    serialize_aliases,
+    serialize_stats,
+)
+from awesome_crawler.urls import AliasIndex
+
+
+def test_stats_round_trip():
+    stats = [ListStats("LIST1", 1.5, 10, 3), ListStats("LIST2", 60, 0, 0, True)]
+
+    assert deserialize_stats(serialize_stats(stats)) == {s.name: s for s in stats}
+
+
+def test_unknown_lists_cost_as_much_as_the_slowest():
+    stats = {
+        "fast": ListStats("fast", 1, 1, 1),
+        "slow": ListStats("slow", 100, 1000, 500),
+    }
+
+    costs = estimate_costs(["fast", "slow", "new"], stats)
+
+    assert costs == {"fast": 1, "slow": 100, "new": 100}
+    assert estimate_costs(["new"], {}) == {"new": 0}
+
+
+def test_timed_out_lists_cost_the_most():
+    stats = {
+        "slow": ListStats("slow", 100, 1000, 500),
+        "truncated": ListStats("truncated", 60, 10, 5, timed_out=True),
+    }
+
+    assert estimate_costs(["slow", "truncated"], stats) == {"slow": 100, "truncated": 100}
+    assert estimate_costs(["slow", "truncated"], stats, 120)["truncated"] == 120
+
+
+def test_lists_without_a_duration_cost_their_commits_and_items():
+    stats = {
+        "measured": ListStats("measured", 10, 80, 20),
+        "unmeasured": ListStats("unmeasured", 0, 40, 10),
+    }
+
+    assert estimate_costs(["unmeasured"], stats)["unmeasured"] == 0
+    assert estimate_costs(["measured", "unmeasured"], stats) == {
+        "measured": 10,
+        "unmeasured": 5,
+    }
+
+
+def test_merge_keeps_lists_not_crawled():
+    previous = {
+        "LIST1": ListStats("LIST1", 1, 1, 1),
+        "LIST2": ListStats("LIST2", 2, 2, 2),
+    }
+
+    merged = merge_stats(previous, [ListStats("LIST2", 3, 3, 3)])
+
+    assert merged == [ListStats("LIST1", 1, 1, 1), ListStats("LIST2", 3, 3, 3)]
+
+
+def test_aliases_round_trip():
+    index = AliasIndex({"https://github.com/old/awesome": "https://github.com/new/awesome"})
+
+    assert deserialize_aliases(serialize_aliases(index)) == index
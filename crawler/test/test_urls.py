@@ -0,0 +1,74 @@
+from unittest import mock
+
+from awesome_crawler import urls
+from awesome_crawler.urls import AliasIndex, canonical_url, resolve_redirects
+
+
+def test_canonical_url_ignores_what_does_not_change_the_repository():
+    variants = [
+        "https://github.com/sindresorhus/awesome",
+        "http://github.com/sindresorhus/awesome/",
+        "https://www.GitHub.com/Sindresorhus/Awesome.git",
+        "https://github.com/sindresorhus/awesome#readme",
+        "https://github.com/sindresorhus/awesome?tab=readme-ov-file",
+        "https://github.com/sindresorhus/awesome/blob/main/readme.md",
+        " https://github.com/sindresorhus/awesome\n",
+    ]
+
+    assert {canonical_url(url) for url in variants} == {
+        "https://github.com/sindresorhus/awesome"
+    }
+
+
+def test_canonical_url_keeps_the_path_of_other_hosts():
+    assert canonical_url("https://gitlab.com/Group/Sub/Repo/") == (
+        "https://gitlab.com/Group/Sub/Repo"
+    )
+    assert canonical_url("") is None
+    assert canonical_url("git@github.com:owner/repo.git") is None
+
+
+def test_alias_index_follows_renames():
+    index = AliasIndex()
+    index.add("https://github.com/old/awesome", "https://github.com/new/awesome")
+    index.add("https://github.com/new/awesome", "https://github.com/newest/awesome")
+    index.add("https://github.com/a/a", "https://github.com/A/A/")
+
+    assert index.resolve("http://github.com/Old/awesome.git") == (
+        "https://github.com/newest/awesome"
+    )
+    assert index.resolve("https://github.com/other/awesome") == (
+        "https://github.com/other/awesome"
+    )
+    assert len(index.aliases) == 2
+
+
+def test_alias_index_stops_on_cycles():
+    index = AliasIndex({"https://github.com/a/a": "https://github.com/b/b"})
+    index.aliases["https://github.com/b/b"] = "https://github.com/a/a"
+
+    assert index.resolve("https://github.com/a/a") == "https://github.com/a/a"
+
+
+def test_resolve_redirects_only_asks_github():
+    targets = {"https://github.com/old/awesome": "https://github.com/New/Awesome"}
+    index = AliasIndex()
+
+    with mock.patch.object(urls, "redirect_target", side_effect=targets.get) as get:
+        resolve_redirects(
+            [
+                "https://github.com/old/awesome#readme",
+                "https://github.com/old/awesome",
+                "https://github.com/same/awesome",
+                "https://example.com/awesome",
+            ],
+            index,
+        )
+
+    assert sorted(call.args[0] for call in get.call_args_list) == [
+        "https://github.com/old/awesome",
+        "https://github.com/same/awesome",
+    ]
+    assert index.aliases == {
+        "https://github.com/old/awesome": "https://github.com/new/awesome"
+    }